@@ -3,8 +3,11 @@ from bs4 import BeautifulSoup
 import datetime
 import json
 from Src.Utilities.info import get_info_kitsu
+from Src.Utilities.metacache import metadata_cache
+from Src.Utilities.cookies import get_jar
 import Src.Utilities.config as config
 import re
+import asyncio
 from fake_headers import Headers  
 random_headers = Headers()
 proxies = {}
@@ -31,6 +34,8 @@ else:
 
 
 AW_DOMAIN = config.AW_DOMAIN
+#Candidate info pages fetched at the same time
+INFO_CONCURRENCY = 4
 months = {
         "Gennaio": "January", "Febbraio": "February", "Marzo": "March", 
         "Aprile": "April", "Maggio": "May", "Giugno": "June", 
@@ -55,26 +60,34 @@ async def security_cookie (response):
             f"SecurityAW-{unknown_chars}": Security_Cookie
         }
         return cookies
+#SecurityAW cookie shared by every AnimeWorld request, obtained again only when the site challenges us
+aw_cookies = get_jar("AnimeWorld", ttl = 3600)
+
+async def aw_get(client,url,**kwargs):
+    '''
+    GET with the shared SecurityAW cookie. A challenge (202, or a page that sets a new SecurityAW cookie)
+    refreshes the jar once for every concurrent request and the request is sent again
+    '''
+    version = aw_cookies.version
+    response = await client.get(ForwardProxy + url,allow_redirects=True, impersonate = "chrome124", cookies = aw_cookies.get(), proxies = proxies, **kwargs)
+    cookies = await security_cookie(response)
+    if response.status_code == 202 or (cookies and cookies.items() - aw_cookies.get().items()):
+        cookies = await aw_cookies.refresh(lambda: security_cookie(response), version)
+        response = await client.get(ForwardProxy + url,allow_redirects=True, impersonate = "chrome124", cookies = cookies, proxies = proxies, **kwargs)
+    return response
+
 async def get_mp4(anime_url,ismovie,episode,client):
-    cookies = {}
     if ForwardProxy != "":
-        response = await client.get(ForwardProxy + anime_url,allow_redirects=True,impersonate = "chrome124",proxies=proxies)
+        response = await aw_get(client,anime_url)
         anime_url = f'{AW_DOMAIN}/{response.url.replace(ForwardProxy,"")}?d=1'
-        response = await client.get(ForwardProxy + anime_url, allow_redirects=True,  cookies = cookies,impersonate = "chrome124",proxies=proxies)
-        cookies = await security_cookie(response)
-        response = await client.get(ForwardProxy + anime_url, allow_redirects=True,  cookies = cookies,impersonate = "chrome124",proxies=proxies)
-    else:
-        response = await client.get(ForwardProxy + anime_url, allow_redirects=True,  cookies = cookies,impersonate = "chrome124",proxies=proxies)
+    response = await aw_get(client,anime_url)
     soup = BeautifulSoup(response.text,'lxml')
     if ismovie == 0:
         episode_page = soup.find('a', {'data-episode-num':episode })
         if episode_page is None:
             return None
         episode_page = f'{AW_DOMAIN}{episode_page["href"]}'
-        response = await client.get(ForwardProxy + episode_page,allow_redirects=True, cookies = cookies,impersonate = "chrome124", proxies=proxies)
-        if response.status_code == 202:
-            cookies = await security_cookie(response)
-            response = await client.get(ForwardProxy + episode_page,allow_redirects=True, cookies = cookies,impersonate = "chrome124", proxies=proxies)
+        response = await aw_get(client,episode_page)
         soup = BeautifulSoup(response.text,'lxml')
 
     a_tag  = soup.find('a', {'id': 'alternativeDownloadLink', 'class': 'm-1 btn btn-sm btn-primary'}) 
@@ -87,41 +100,60 @@ async def get_mp4(anime_url,ismovie,episode,client):
 
 
 
-async def search(showname,date,ismovie,episode,client):
+def same_release(release_date,date):
+    for ita, eng in months.items():
+        release_date = release_date.replace(ita, eng)
+    release_date = datetime.datetime.strptime(release_date, "%d %B %Y").strftime("%Y-%m-%d")
+    date_object = datetime.datetime.strptime(date, "%Y-%m-%d")
+    return (release_date == date or 
+    release_date == (date_object + datetime.timedelta(days=1)).strftime("%Y-%m-%d") or
+    release_date == (date_object - datetime.timedelta(days=1)).strftime("%Y-%m-%d"))
+
+def successful(results):
+    '''The strings gathered with return_exceptions, the failures are logged instead of being dropped silently'''
+    for result in results:
+        if isinstance(result, Exception):
+            print("Animeworld failed",result)
+    return [result for result in results if isinstance(result, str)]
+
+async def check_candidate(anime,date,semaphore,client):
+    '''
+    Return the anime path if the release date on its info page is the Kitsu one (±1 day)
+    '''
+    anime_info_url = f'{AW_DOMAIN}/{anime["data-tip"]}'
+    async with semaphore:
+        response = await aw_get(client,anime_info_url)
+    pattern = r'<label>Data di uscita:</label>\s*<span>\s*(.*?)\s*</span>'
+    match = re.search(pattern, response.text, re.S)
+    if match and same_release(match.group(1).strip(),date):
+        return anime["href"]
+    return None
+
+async def find_anime(showname,date,client):
+    '''
+    Paths of the AnimeWorld animes matching showname and release date.
+    The info pages of the candidates are fetched concurrently, at most INFO_CONCURRENCY at a time
+    '''
     search_year = date[:4] 
     headers = random_headers.generate()
     link = f'{AW_DOMAIN}/filter?year={search_year}&sort=2&keyword={showname}'
-    response = await client.get(ForwardProxy + link,allow_redirects=True, impersonate = "chrome124", headers = headers, proxies = proxies)
-    if response.status_code == 202:
-        cookies = await security_cookie(response)
-        response = await client.get(ForwardProxy + link,allow_redirects=True, impersonate = "chrome124", proxies = proxies, headers = headers, cookies = cookies)
-    else:
-        cookies = {}
+    response = await aw_get(client,link,headers = headers)
     soup = BeautifulSoup(response.text,'lxml')
     anime_list = soup.find_all('a', class_=['poster', 'tooltipstered'])
-    final_urls = []
-    for anime in anime_list:
-        anime_info_url = f'{AW_DOMAIN}/{anime["data-tip"]}'
-        response = await client.get(ForwardProxy + anime_info_url,allow_redirects=True, impersonate = "chrome124", cookies = cookies, proxies = proxies)
-        if response.status_code == 202:
-            cookies = await security_cookie(response)
-            response = await client.get(ForwardProxy + anime_info_url,allow_redirects=True, impersonate = "chrome124", cookies = cookies, proxies = proxies)
-        pattern = r'<label>Data di uscita:</label>\s*<span>\s*(.*?)\s*</span>'
-        match = re.search(pattern, response.text, re.S)
-        release_date = match.group(1).strip()
-        for ita, eng in months.items():
-            release_date = release_date.replace(ita, eng)
-        release_date_object = datetime.datetime.strptime(release_date, "%d %B %Y")
-        date_object = datetime.datetime.strptime(date, "%Y-%m-%d")
-        release_date = release_date_object.strftime("%Y-%m-%d")
-        if (release_date == date or 
-    release_date == (datetime.datetime.strptime(date, "%Y-%m-%d") + datetime.timedelta(days=1)).strftime("%Y-%m-%d") or
-    release_date == (datetime.datetime.strptime(date, "%Y-%m-%d") - datetime.timedelta(days=1)).strftime("%Y-%m-%d")):
-            anime_url = f'{AW_DOMAIN}{anime["href"]}'
-            final_url = await get_mp4(anime_url,ismovie,episode,client)
-            if final_url:
-                final_urls.append(final_url)
-    return final_urls
+    semaphore = asyncio.Semaphore(INFO_CONCURRENCY)
+    results = await asyncio.gather(*(check_candidate(anime,date,semaphore,client) for anime in anime_list), return_exceptions=True)
+    return successful(results)
+
+async def get_mp4s(anime_paths,ismovie,episode,client):
+    results = await asyncio.gather(*(get_mp4(f'{AW_DOMAIN}{path}',ismovie,episode,client) for path in anime_paths), return_exceptions=True)
+    return successful(results)
+
+async def search(showname,date,ismovie,episode,client,kitsu_id = None):
+    anime_paths = await find_anime(showname,date,client)
+    if anime_paths and kitsu_id:
+        #Next episodes of the same show go straight to get_mp4
+        metadata_cache.set(f"animeworld:{kitsu_id}",anime_paths)
+    return await get_mp4s(anime_paths,ismovie,episode,client)
 
 async def animeworld(id,client):
     try:
@@ -131,6 +163,11 @@ async def animeworld(id,client):
             episode = None
         else:
             episode = id.split(":")[2]
+        anime_paths = metadata_cache.get(f"animeworld:{kitsu_id}")
+        if anime_paths:
+            final_urls = await get_mp4s(anime_paths,ismovie,episode,client)
+            if final_urls:
+                return final_urls
         showname,date = await get_info_kitsu(kitsu_id,client)
         #Format Showname
         for key in showname_replace:
@@ -142,7 +179,7 @@ async def animeworld(id,client):
                     showname = showname.split("’")[0]
                 if ":" in showname:
                     showname = showname.split(":")[0]
-        final_urls = await search(showname,date,ismovie,episode,client)
+        final_urls = await search(showname,date,ismovie,episode,client,kitsu_id)
         return final_urls
     except Exception as e:
         print("Animeworld failed",e)
@@ -285,7 +285,7 @@ async def cb01(id,client,MFP):
         if "tt" in id:
             showname, date = await get_info_imdb(real_id,ismovie,type,client)
         elif  "tmdb" in real_id:
-            showname, date = get_info_tmdb(real_id,ismovie,type)
+            showname, date = await get_info_tmdb(real_id,ismovie,type)
         if ismovie == 0:
             season = general[2]
             episode = general[3]
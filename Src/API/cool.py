@@ -121,7 +121,7 @@ async def cool(imdb,client):
         else:
             tmdba = imdb_id.replace("tmdb:","")
 
-        showname = get_info_tmdb(tmdba,ismovie,type)
+        showname = await get_info_tmdb(tmdba,ismovie,type)
         
 
         slug = await search_imdb(showname,tmdba,client)
@@ -1,21 +1,27 @@
-import requests
 import re
 from bs4 import BeautifulSoup, SoupStrainer
 from Src.Utilities.info import get_info_imdb, is_movie, get_info_tmdb
 import urllib.parse
 import Src.Utilities.config as config
+from Src.Utilities.cookies import get_jar
 import urllib.parse
 DDL_DOMAIN = config.DDL_DOMAIN
 ips4_device_key = config.ips4_device_key
 ips4_login_key = config.ips4_login_key
 ips4_member_id = config.ips4_member_id
 ips4_IPSSessionFront = config.ips4_IPSSessionFront
-cookies = {
+#Login cookies from config.json, plus whatever the site sets (the session cookie rotates)
+ddl_cookies = get_jar("DDLStream", cookies = {
     'ips4_device_key': ips4_device_key,
     'ips4_IPSSessionFront': ips4_IPSSessionFront,
     'ips4_member_id': ips4_member_id,
     'ips4_login_key': ips4_login_key,
-    }
+    })
+
+async def ddl_get(client,url,**kwargs):
+    response = await client.get(url, cookies = ddl_cookies.get(), **kwargs)
+    ddl_cookies.absorb(response)
+    return response
 
 async def search_series(client,id,season,episode,showname):
     showname = showname.replace(" ", "%20").replace("–", "+").replace("—","+")
@@ -24,7 +30,7 @@ async def search_series(client,id,season,episode,showname):
     a_tags = soup.find_all('a', {'data-linktype': 'link'})
     for a in a_tags:
         href = a['href']
-        response = await client.get(href, cookies = cookies)
+        response = await ddl_get(client,href)
         soup = BeautifulSoup(response.text, 'lxml')
         movie_ids = soup.find_all('a',{'rel':'external nofollow'})
         for database in movie_ids:
@@ -65,7 +71,7 @@ async def get_episode(client,link,episode):
     }
 
 
-    response = await client.get(link, cookies = cookies, headers = headers, params = params, impersonate="chrome120")
+    response = await ddl_get(client, link, headers = headers, params = params, impersonate="chrome120")
 
     pattern = rf'<a\s+href="([^"]+)"[^>]*>\s*Part {episode}\s*</a>'
     match = re.search(pattern, response.text)
@@ -83,7 +89,7 @@ async def search_movie(client,showname,id):
     a_tags = soup.find_all('a', {'data-linktype': 'link'})
     for a in a_tags:
         href = a['href']
-        response = requests.get(href, cookies = cookies)
+        response = await ddl_get(client,href)
         soup = BeautifulSoup(response.text, 'lxml', parse_only=SoupStrainer('a'))
         movie_ids = soup.find_all('a',{'rel':'external nofollow'})
         for database in movie_ids:
@@ -98,12 +104,11 @@ async def search_movie(client,showname,id):
 
 
 async def get_mp4(client,link):
-    response = await client.get(link, cookies = cookies)   
+    response = await ddl_get(client,link)
     soup = BeautifulSoup(response.text,'lxml',parse_only=SoupStrainer('source'))
     source_tag = soup.find('source')
     final_url = source_tag['src']
-    res = source_tag.get('res')
-    return final_url,res
+    return final_url
 
 
 
@@ -127,7 +132,7 @@ async def ddlstream(imdb,client):
         if "tt" in imdb:
                 showname = await get_info_imdb(id,ismovie,type,client)
         else:
-            showname = get_info_tmdb(id,ismovie,type)
+            showname = await get_info_tmdb(id,ismovie,type)
         if ismovie == 0:
             season  = general[2]
             episode = general[3]
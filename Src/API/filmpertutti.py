@@ -132,7 +132,7 @@ async def filmpertutti(imdb,client,MFP):
             #Get showname and date
             tmdba = imdb_id.replace("tmdb:","")
             imdb_id = await get_IMDB_id_from_TMDb_id(tmdba,client)
-            showname = get_info_tmdb(tmdba,ismovie,type)
+            showname = await get_info_tmdb(tmdba,ismovie,type)
         showname = showname.replace(" ", "+").replace("–", "+").replace("—","+")
         showname = urllib.parse.quote_plus(showname)
         #   Build the query
@@ -116,7 +116,7 @@ async def guardaserie(id,client):
         if "tt" in id:
             showname,date = await get_info_imdb(clean_id,ismovie,type,client)
         else:
-            showname,date = get_info_tmdb(clean_id,ismovie,type)
+            showname,date = await get_info_tmdb(clean_id,ismovie,type)
         showname = showname.replace("'"," ")
         if "Guru" in showname:
             showname = showname.split("-")[0]
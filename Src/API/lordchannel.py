@@ -88,7 +88,7 @@ async def lordchannel(imdb,client):
                 tmdba = await get_TMDb_id_from_IMDb_id(imdb_id,client)
             else:
                 tmdba = imdb_id
-        showname,date = get_info_tmdb(tmdba,ismovie,type)
+        showname,date = await get_info_tmdb(tmdba,ismovie,type)
         video_url,quality = await search(showname,date,season,episode,ismovie,client)
         url = await get_m3u8(video_url,client)
         url = url.replace('"','')
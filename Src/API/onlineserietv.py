@@ -129,7 +129,7 @@ async def onlineserietv(id,client):
         if "tt" in id:
                 showname,date = await get_info_imdb(clean_id,ismovie,type,client)
         else:
-            showname,date = get_info_tmdb(clean_id,ismovie,type)
+            showname,date = await get_info_tmdb(clean_id,ismovie,type)
         showname = showname.replace("'"," ")
         flexy_link,name = await search(showname,date,client,ismovie,episode,season)
         flexy_link = flexy_link.replace("fxf","fxe")
@@ -5,9 +5,14 @@ import Src.Utilities.config as config
 import json
 import random
 import re
+import time
+import asyncio
 from urllib.parse import urlparse, parse_qs
 from fake_headers import Headers  
 from Src.Utilities.loadenv import load_env  
+from Src.Utilities.singleflight import SingleFlight
+from Src.Utilities.metacache import metadata_cache
+from Src.Utilities.cache import TTLCache
 import urllib.parse
 User_Agent= "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:127.0) Gecko/20100101 Firefox/127.0"
 
@@ -51,11 +56,24 @@ else:
     ForwardProxy = ""
 #Get domain
 SC_DOMAIN = config.SC_DOMAIN
+SC_LOCAL_EXTRACTOR = config.SC_LOCAL_EXTRACTOR
 Public_Instance = config.Public_Instance
 Alternative_Link = env_vars.get('ALTERNATIVE_LINK')
 headers = Headers()
 #GET VERSION OF STREAMING COMMUNITY:
-async def get_version(client):
+#The Inertia version only changes when the site deploys, so it is cached for the whole process
+VERSION_TTL = 3600
+#Title pages checked at the same time when fast search is off
+VERIFY_CONCURRENCY = 4
+FALLBACK_VERSION = "65e52dcf34d64173542cd2dc6b8bb75b"
+sc_version = {"value": None, "expires": 0}
+version_flight = SingleFlight()
+
+def remember_version(version):
+    sc_version["value"] = version
+    sc_version["expires"] = time.time() + VERSION_TTL
+
+async def fetch_version(client):
     #Extract the version from the main page of the site
     #You can extract it from any page of the site but I chose one of the lightiest
 
@@ -70,17 +88,39 @@ async def get_version(client):
 
         # Extract version
         version = json.loads(soup.find("div", {"id": "app"}).get("data-page"))['version']
+        remember_version(version)
         return version
     except Exception as e:
         print("Couldn't find the version",e)
-        version = "65e52dcf34d64173542cd2dc6b8bb75b"
-        return version
+        #Better an old version than the hardcoded one
+        return sc_version["value"] or FALLBACK_VERSION
+
+async def get_version(client,refresh = False):
+    '''
+    Cached Inertia version, refresh = True after the site answered 409 (version mismatch)
+    '''
+    if not refresh and sc_version["value"] and time.time() < sc_version["expires"]:
+        return sc_version["value"]
+    return await version_flight.do("version", lambda: fetch_version(client))
+
+async def verify_title(tid,slug,client):
+    '''
+    Open the title page of a search result and return its TMDB id
+    '''
+    random_headers = headers.generate()
+    random_headers['Referer'] = f"{SC_DOMAIN}/"
+    random_headers['Origin'] = f"{SC_DOMAIN}"
+    response = await client.get ( ForwardProxy + f'{SC_DOMAIN}/it/titles/{tid}-{slug}', headers = random_headers, allow_redirects=True,impersonate = "chrome124", proxies = proxies)
+    soup = BeautifulSoup(response.text, "lxml")
+    data = json.loads(soup.find("div", {"id": "app"}).get("data-page"))
+    remember_version(data['version'])
+    return str(data['props']['title']['tmdb_id']),data['version']
 
-async def search(query,date,ismovie, client,SC_FAST_SEARCH,movie_id):
+async def search(query,date,ismovie, client,SC_FAST_SEARCH,tmdb_id):
     '''
     This function is used to search for a movie or a show in the Streaming Community website using the API
-    After it checks if the imdb id given is the same as the one in the website
-    We need to convert imdb id to tmdb id because often imdb ids are missing
+    After it checks if the tmdb id given is the same as the one in the website
+    The candidates are checked concurrently, the first match cancels the others and is saved in the index
     '''
     random_headers = headers.generate()
     random_headers['Referer'] = f"{SC_DOMAIN}/"
@@ -91,59 +131,72 @@ async def search(query,date,ismovie, client,SC_FAST_SEARCH,movie_id):
     response = await client.get(ForwardProxy + query, headers = random_headers, allow_redirects=True, impersonate = "chrome124", proxies = proxies)
     print(response)
     response = response.json()
-    for item in response['data']:
-        tid = item['id']
-        slug = item['slug']
-        type = item['type']
-        if type == "tv":
-            type = 0
-        elif type == "movie":
-            type = 1
-        if type == ismovie: 
-            #Added a Check to see if the result is what it is supposed to be
-            if SC_FAST_SEARCH == "0":
-                random_headers = headers.generate()
-                random_headers['Referer'] = f"{SC_DOMAIN}/"
-                random_headers['Origin'] = f"{SC_DOMAIN}"
-                response = await client.get ( ForwardProxy + f'{SC_DOMAIN}/it/titles/{tid}-{slug}', headers = random_headers, allow_redirects=True,impersonate = "chrome124", proxies = proxies)
-                soup = BeautifulSoup(response.text, "lxml")
-                data = json.loads(soup.find("div", {"id": "app"}).get("data-page"))
-                version = data['version']
-                if "tt" in movie_id:
-                    movie_id = str(await get_TMDb_id_from_IMDb_id(movie_id,client))
-                    print(movie_id)
-                    #Here we need to convert because the IMDB ID is often bugged
-                tmdb_id = str(data['props']['title']['tmdb_id'])
-                if tmdb_id == movie_id:
-                    return tid,slug,version
-            elif SC_FAST_SEARCH == "1":
-                version = await get_version(client)
+    candidates = [(item['id'],item['slug']) for item in response['data'] if {"tv": 0, "movie": 1}.get(item['type']) == ismovie]
+    if not candidates:
+        print("Couldn't find anything")
+        return None
+    if SC_FAST_SEARCH == "1":
+        tid,slug = candidates[0]
+        version = await get_version(client)
+        return tid,slug,version
+    #Added a Check to see if the result is what it is supposed to be
+    #The semaphore keeps the best ranked results first and doesn't hammer the site
+    semaphore = asyncio.Semaphore(VERIFY_CONCURRENCY)
+    async def check(tid,slug):
+        async with semaphore:
+            candidate_tmdb_id,version = await verify_title(tid,slug,client)
+        return tid,slug,candidate_tmdb_id,version
+    tasks = [asyncio.ensure_future(check(tid,slug)) for tid,slug in candidates]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            try:
+                tid,slug,candidate_tmdb_id,version = await finished
+            except Exception as e:
+                print("MammaMia: StreamingCommunity candidate check failed",e)
+                continue
+            if candidate_tmdb_id == tmdb_id:
+                metadata_cache.set(f"sc_title:{ismovie}:{tmdb_id}",[tid,slug])
                 return tid,slug,version
-        else:
-            print("Couldn't find anything")
+    finally:
+        for task in tasks:
+            task.cancel()
+    print("Couldn't find anything")
+    return None
+
+async def sc_tmdb_id(imdb_id,client):
+    #Here we need to convert because the IMDB ID is often bugged
+    if "tt" in imdb_id:
+        return str(await get_TMDb_id_from_IMDb_id(imdb_id,client))
+    return imdb_id.replace("tmdb:","")
 
         
-async def get_film(tid,version,client,MFP):  
-    ''''
-    This function is used to get the link of the m3u8 from the Streaming Community player,vixcloud
+async def vixcloud_extract(tid,version,client,ismovie,episode_id = None):
     '''
+    In-process VixCloud extractor, it does what the MediaFlow Proxy VixCloud extractor does:
+    Streaming Community iframe -> vixcloud embed -> playlist with its token and expires.
+    It returns the same shape as the MFP extractor answer, so MFP is only needed to proxy the playback
+    '''
+    if ismovie == 0 and episode_id is None:
+        #Without an episode the iframe serves the title's default stream, never return it for an episode
+        raise ValueError(f"No episode id for StreamingCommunity title {tid}")
     random_headers = headers.generate()
     random_headers['Referer'] = f"{SC_DOMAIN}/"
     random_headers['Origin'] = f"{SC_DOMAIN}"
-    random_headers['x-inertia'] = "true"
-    random_headers['x-inertia-version'] = version
+    if ismovie == 1:
+        random_headers['x-inertia'] = "true"
+        random_headers['x-inertia-version'] = version
+        params = None
+    else:
+        params = {
+                    'episode_id': episode_id, 
+                    'next_episode': '1'
+                }
     random_headers['User-Agent'] = User_Agent
     random_headers['user-agent'] = User_Agent
     #Access the iframe
-    url = f'{SC_DOMAIN}/it/iframe/{tid}'
-    if MFP == "1":
-        url = f'{SC_DOMAIN}/it/iframe/{tid}'
-        quality = "Unknown"
-        return url,quality
-    response = await client.get(ForwardProxy + url, headers=random_headers, allow_redirects=True,impersonate = "chrome124", proxies = proxies)
-    iframe = BeautifulSoup(response.text, 'lxml')
+    response = await client.get(ForwardProxy + f'{SC_DOMAIN}/it/iframe/{tid}', params=params, headers=random_headers, allow_redirects=True,impersonate = "chrome124", proxies = proxies)
     #Get the link of iframe
-    iframe = iframe.find('iframe').get("src")
+    iframe = BeautifulSoup(response.text, 'lxml').find('iframe').get("src")
     #Get the ID containted in the src of iframe
     vixid = iframe.split("/embed/")[1].split("?")[0]
     parsed_url = urlparse(iframe)
@@ -166,32 +219,46 @@ async def get_film(tid,version,client,MFP):
     #Example url  https://vixcloud.co/playlist/231315?b=1&token=bce060eec3dc9d1965a5d258dc78c964&expires=1728995040&rendition=1080p
     url = f'https://vixcloud.co/playlist/{vixid}.m3u8?token={token}&expires={expires}'
     if 'canPlayFHD' in query_params:
-       canPlayFHD = 'h=1'
        url += "&h=1"
     if 'b=1' in base_url:
-         url += "&b=1"   
-    '''   
-    if 'b' in query_params:
-       b = 'b=1'
        url += "&b=1"
+    return {
+        "destination_url": url,
+        "request_headers": {"User-Agent": User_Agent},
+        "mediaflow_endpoint": "hls_manifest_proxy",
+        "quality": quality
+    }
+
+async def vixcloud_extract_url(iframe_url,client):
     '''
+    Same as vixcloud_extract but from a Streaming Community iframe URL, like the d parameter of the MFP extractor
     '''
-    if quality == "1080":
-        if "&h" in url:
-            url = url
-        elif "&b" in url and quality == "1080":
-            url = url.replace("&b=1","&h=1")
-        elif quality == "1080" and "&b" and "&h" not in url:
-            url = url + "&h=1"
-    else:
-        url = url + f"&token={token}"      
-    '''  
-    return url,quality
+    parsed_url = urlparse(iframe_url)
+    tid = parsed_url.path.rstrip("/").split("/")[-1]
+    episode_id = parse_qs(parsed_url.query).get('episode_id', [None])[0]
+    version = await get_version(client)
+    #An iframe URL without episode_id is a film one
+    ismovie = 1 if episode_id is None else 0
+    return await vixcloud_extract(tid,version,client,ismovie,episode_id)
 
-async def get_season_episode_id(tid,slug,season,episode,version,client):
-    '''
-    This function is used to get the ID of the episode in the Streaming Community website
+async def get_film(tid,version,client,MFP):  
+    ''''
+    This function is used to get the link of the m3u8 from the Streaming Community player,vixcloud
     '''
+    if MFP == "1" and SC_LOCAL_EXTRACTOR == "0":
+        #The remote MFP extractor will do the extraction
+        url = f'{SC_DOMAIN}/it/iframe/{tid}'
+        quality = "Unknown"
+        return url,quality
+    data = await vixcloud_extract(tid,version,client,1)
+    return data["destination_url"],data["quality"]
+
+#Episode ids of a season (number -> id) for every episode of it, binge watching asks for the same season again and again
+SEASON_TTL = 6 * 3600
+season_cache = TTLCache(max_entries=2000)
+season_flight = SingleFlight()
+
+async def fetch_season_episodes(tid,slug,season,version,client):
     random_headers = headers.generate()
     random_headers['Referer'] = f"{SC_DOMAIN}/"
     random_headers['Origin'] = f"{SC_DOMAIN}"
@@ -203,77 +270,63 @@ async def get_season_episode_id(tid,slug,season,episode,version,client):
     #Set some basic headers for the request  
       #Get episode ID 
     response = await client.get(ForwardProxy + f'{SC_DOMAIN}/it/titles/{tid}-{slug}/season-{season}', headers=random_headers, allow_redirects=True, impersonate = "chrome124", proxies = proxies)
-    # Print the json got
+    if response.status_code == 409:
+        #Inertia version mismatch: the site has been updated, get the new version and try again
+        random_headers['x-inertia-version'] = await get_version(client,refresh = True)
+        response = await client.get(ForwardProxy + f'{SC_DOMAIN}/it/titles/{tid}-{slug}/season-{season}', headers=random_headers, allow_redirects=True, impersonate = "chrome124", proxies = proxies)
     json_response = response.json().get('props', {}).get('loadedSeason', {}).get('episodes', [])
-    for dict_episode in json_response:
-        if dict_episode['number'] == episode:
-            return dict_episode['id']
+    episodes = {dict_episode['number']: dict_episode['id'] for dict_episode in json_response}
+    if episodes:
+        season_cache.set((tid,season),episodes,SEASON_TTL)
+    return episodes
+
+async def get_season_episodes(tid,slug,season,version,client,refresh = False):
+    '''
+    Bulk API: the ids of every episode of a season, {number: id}, from a single fetch
+    '''
+    episodes = None if refresh else season_cache.get((tid,season))
+    if episodes is None:
+        episodes = await season_flight.do((tid,season), lambda: fetch_season_episodes(tid,slug,season,version,client))
+    return episodes
+
+async def get_season_episode_id(tid,slug,season,episode,version,client):
+    '''
+    This function is used to get the ID of the episode in the Streaming Community website
+    '''
+    cached = season_cache.get((tid,season))
+    if cached is not None and episode in cached:
+        return cached[episode]
+    #Not cached yet, or maybe a new episode came out after we cached the season: either way a single fetch
+    episodes = await get_season_episodes(tid,slug,season,version,client,refresh = cached is not None)
+    return episodes.get(episode)
 
 async def get_episode_link(episode_id,tid,version,client,MFP):
     ''''
     This function is used to get the link of the m3u8 from the Streaming Community player,vixcloud
     '''
-    #The parameters for the request
-    random_headers = headers.generate()
-    random_headers['Referer'] = f"{SC_DOMAIN}/"
-    random_headers['Origin'] = f"{SC_DOMAIN}"
-    random_headers['User-Agent'] = User_Agent
-    random_headers['user-agent'] = User_Agent
-    params = {
-                'episode_id': episode_id, 
-                'next_episode': '1'
-            }
-    #Let's try to get the link from iframe source
-        # Make a request to get iframe source
-    if MFP == "1":
+    if MFP == "1" and SC_LOCAL_EXTRACTOR == "0":
+        #The remote MFP extractor will do the extraction
         url = f'{SC_DOMAIN}/it/iframe/{tid}?episode_id={episode_id}&next_episode=1'
         quality = "Unknown"
         return url,quality
-    response = await client.get(ForwardProxy + f"{SC_DOMAIN}/it/iframe/{tid}", params=params, headers = random_headers, allow_redirects=True, impersonate = "chrome124", proxies = proxies)
+    data = await vixcloud_extract(tid,version,client,0,episode_id)
+    return data["destination_url"],data["quality"]
 
-    # Parse response with BeautifulSoup to get iframe source
-    soup = BeautifulSoup(response.text, "lxml")
-    iframe = soup.find("iframe").get("src")
-    vixid = iframe.split("/embed/")[1].split("?")[0]
-    random_headers = headers.generate()
-    random_headers['Referer'] = f"{SC_DOMAIN}/"
-    random_headers['Origin'] = f"{SC_DOMAIN}"
-    random_headers['x-inertia'] = "true"
-    random_headers['x-inertia-version'] = version
-    random_headers['User-Agent'] = User_Agent
-    random_headers['user-agent'] = User_Agent
-    parsed_url = urlparse(iframe)
-    query_params = parse_qs(parsed_url.query)
-    #Get real token and expires by looking at the page in the iframe, vixcloud/embed
-    resp = await client.get(ForwardProxy + iframe, headers = random_headers, allow_redirects=True, impersonate = "chrome124", proxies = proxies2)
-    soup=  BeautifulSoup(resp.text, "lxml")
-    script = soup.find("body").find("script").text
-    token = re.search(r"'token':\s*'(\w+)'", script).group(1)
-    expires = re.search(r"'expires':\s*'(\d+)'", script).group(1)
-    quality = re.search(r'"quality":(\d+)', script).group(1)
-    base_url = re.search(r"url:\s*'(https?://[^']+)'", script).group(1)  
-
-    #Example url  https://vixcloud.co/playlist/231315?b=1&token=bce060eec3dc9d1965a5d258dc78c964&expires=1728995040&rendition=1080p
-    url = f'https://vixcloud.co/playlist/{vixid}.m3u8?token={token}&expires={expires}'
-    if 'canPlayFHD' in query_params:
-       canPlayFHD = 'h=1'
-       url += "&h=1"
-    if 'b=1' in base_url:
-       b = 'b=1'
-       url += "&b=1"
-    '''
-    if quality == "1080":
-        if "&h" in url:
-            url = url
-        elif "&b" in url and quality == "1080":
-            url = url.replace("&b=1","&h=1")
-        elif quality == "1080" and "&b" and "&h" not in url:
-            url = url + "&h=1"
-    else:
-        url = url + f"&token={token}"
-    '''        
-    return url,quality
 
+async def get_link(tid,slug,version,ismovie,season,episode,client,MFP):
+    if ismovie == 1:
+        #TID means temporaly ID
+        url,quality = await get_film(tid,version,client,MFP)
+        print("MammaMia found results for StreamingCommunity")
+        return url,quality,slug
+    if ismovie == 0:
+        #Uid = URL ID
+        episode_id = await get_season_episode_id(tid,slug,season,episode,version,client)
+        if episode_id is None:
+            #Not on the site (yet): on the index path this also drops the indexed title
+            raise ValueError(f"Episode {season}x{episode} not found on StreamingCommunity")
+        url,quality = await get_episode_link(episode_id,tid,version,client,MFP)
+        return url,quality,slug
 
 async def streaming_community(imdb,client,SC_FAST_SEARCH,MFP):
     try:
@@ -291,10 +344,28 @@ async def streaming_community(imdb,client,SC_FAST_SEARCH,MFP):
         general = await is_movie(imdb)
         ismovie = general[0]
         imdb_id = general[1]
-
         if ismovie == 0 : 
             season = int(general[2])
             episode = int(general[3])
+        else:
+            season = episode = None
+        tmdb_id = None
+        if SC_FAST_SEARCH == "0":
+            #Convert once, every candidate of the search is checked against it
+            tmdb_id = await sc_tmdb_id(imdb_id,client)
+            indexed = metadata_cache.get(f"sc_title:{ismovie}:{tmdb_id}")
+            if indexed:
+                #Title already verified, no need to search
+                tid,slug = indexed
+                version = await get_version(client)
+                try:
+                    return await get_link(tid,slug,version,ismovie,season,episode,client,MFP)
+                except Exception as e:
+                    #The site may have renumbered it, forget it and search again
+                    print("MammaMia: StreamingCommunity indexed title failed",e)
+                    metadata_cache.delete(f"sc_title:{ismovie}:{tmdb_id}")
+
+        if ismovie == 0 : 
             #Check if fast search is enabled or disabled
             if SC_FAST_SEARCH == "1":
                 type = "StreamingCommunityFS"
@@ -307,12 +378,11 @@ async def streaming_community(imdb,client,SC_FAST_SEARCH,MFP):
                     date = None
                     #else just equals them
                     tmdba = imdb_id.replace("tmdb:","")
-                    showname = get_info_tmdb(tmdba,ismovie,type)
+                    showname = await get_info_tmdb(tmdba,ismovie,type)
             elif SC_FAST_SEARCH == "0":
                 type = "StreamingCommunity"
-                if "tt" in imdb:
-                    tmdba = await get_TMDb_id_from_IMDb_id(imdb_id,client)
-                showname,date = get_info_tmdb(tmdba,ismovie,type) 
+                tmdba = tmdb_id
+                showname,date = await get_info_tmdb(tmdba,ismovie,type) 
         #HERE THE CASE IF IT IS A MOVIE
         else:
             if SC_FAST_SEARCH == "1":
@@ -324,7 +394,7 @@ async def streaming_community(imdb,client,SC_FAST_SEARCH,MFP):
                 else:
                         date = None
                         tmdba = imdb_id.replace("tmdb:","")
-                        showname = get_info_tmdb(tmdba,ismovie,type) 
+                        showname = await get_info_tmdb(tmdba,ismovie,type) 
             elif SC_FAST_SEARCH == "0":
                 type = "StreamingCommunity"
                 if "tt" in imdb:
@@ -332,22 +402,13 @@ async def streaming_community(imdb,client,SC_FAST_SEARCH,MFP):
                     showname,date = await get_info_imdb(imdb_id,ismovie,type,client)
                 else:
                         tmdba = imdb_id.replace("tmdb:","")
-                        showname,date = get_info_tmdb(tmdba,ismovie,type) 
+                        showname,date = await get_info_tmdb(tmdba,ismovie,type) 
         
         showname = showname.replace(" ", "+").replace("–", "+").replace("—","+")
         showname = urllib.parse.quote_plus(showname)
         query = f'{SC_DOMAIN}/api/search?q={showname}'
-        tid,slug,version = await search(query,date,ismovie,client,SC_FAST_SEARCH,imdb_id)
-        if ismovie == 1:
-            #TID means temporaly ID
-            url,quality = await get_film(tid,version,client,MFP)
-            print("MammaMia found results for StreamingCommunity")
-            return url,quality,slug
-        if ismovie == 0:
-            #Uid = URL ID
-            episode_id = await get_season_episode_id(tid,slug,season,episode,version,client)
-            url,quality = await get_episode_link(episode_id,tid,version,client,MFP)
-            return url,quality,slug
+        tid,slug,version = await search(query,date,ismovie,client,SC_FAST_SEARCH,tmdb_id)
+        return await get_link(tid,slug,version,ismovie,season,episode,client,MFP)
     except Exception as e:
         print("MammaMia: StreamingCommunity failed",e)
         return None,None,None
@@ -101,7 +101,7 @@ async def streamingwatch(imdb,client):
                tmdba = await get_TMDb_id_from_IMDb_id(imdb_id,client)
            else:
                tmdba = imdb_id
-       showname,date = get_info_tmdb(tmdba,ismovie,type)
+       showname,date = await get_info_tmdb(tmdba,ismovie,type)
        showname = showname.replace(" ", "+").replace("–", "+").replace("—","+").replace("&","")
        hdplayer = await search(showname,season,episode,date,ismovie,client)
        url = await hls_url(hdplayer,client)
@@ -236,11 +236,11 @@ async def tantifilm(imdb,client,TF_FAST_SEARCH):
                     tmdba = imdb_id.replace("tmdb:","")
                     if TF_FAST_SEARCH == "0":
                         type = "Tantifilm" 
-                        showname,date = get_info_tmdb(tmdba,ismovie,type)
+                        showname,date = await get_info_tmdb(tmdba,ismovie,type)
                         url,embed_id = await search(showname,ismovie,date,client)
                     elif TF_FAST_SEARCH == "1":
                         type = "TantifilmFS"
-                        showname= get_info_tmdb(tmdba,ismovie,type)
+                        showname= await get_info_tmdb(tmdba,ismovie,type)
                         url,embed_id = await fast_search(showname,ismovie,client)
             protect_link = await get_nuovo_indirizzo_and_protect_link(url,embed_id,season,episode,client)
             url = await true_url(protect_link,client)
@@ -260,11 +260,11 @@ async def tantifilm(imdb,client,TF_FAST_SEARCH):
             else:
                 if TF_FAST_SEARCH == "0":
                     type = "Tantifilm"
-                    showname,date = get_info_tmdb(imdb,ismovie,type)
+                    showname,date = await get_info_tmdb(imdb,ismovie,type)
                     tid,url = await search(showname,ismovie,date,client)
                 elif TF_FAST_SEARCH == "1":
                     type = "TantifilmFS"
-                    showname = get_info_tmdb(imdb,ismovie,type)
+                    showname = await get_info_tmdb(imdb,ismovie,type)
                     tid,url = await fast_search(showname,ismovie,client)
             protect_link = await get_protect_link(tid,url,client)
             if not isinstance(protect_link, str):
@@ -61,7 +61,7 @@ async def whvx(id,client):
 
         
     elif "tmdb" in id:
-        showname,date = get_info_tmdb(id,ismovie,type)
+        showname,date = await get_info_tmdb(id,ismovie,type)
         params = {
             "query": {
                 "title": showname,
@@ -0,0 +1,108 @@
+import contextvars
+import time
+from collections import deque
+import Src.Utilities.config as config
+
+Breaker_Failures = int(config.Breaker_Failures)
+Breaker_Open_Seconds = float(config.Breaker_Open_Seconds)
+
+#Upstream errors seen by the shared client while a provider call is running
+current_call = contextvars.ContextVar("current_call", default=None)
+
+
+class CircuitBreaker:
+    '''
+    Per provider circuit breaker with a small health score.
+    It keeps the last outcomes and an average latency. After Breaker_Failures failures in a row,
+    or when most of the recent calls failed, it opens and callers skip the provider right away.
+    Once the open period is over a single half-open probe is let through: success closes it,
+    failure opens it again for twice as long (up to 16 times the base period).
+    '''
+    def __init__(self, name, failures=Breaker_Failures, open_seconds=Breaker_Open_Seconds, window=20):
+        self.name = name
+        self.failures = failures
+        self.base_open_seconds = open_seconds
+        self.open_seconds = open_seconds
+        self.outcomes = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.latency = None
+        self.state = "closed"
+        self.opened_at = 0
+        self.probing = False
+        self.last_error = None
+
+    def allow(self):
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.time() - self.opened_at >= self.open_seconds:
+            self.state = "half_open"
+            self.probing = False
+        if self.state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record(self, success, latency=None, error=None):
+        self.outcomes.append(success)
+        if latency is not None:
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        if success:
+            self.consecutive_failures = 0
+            if self.state != "closed":
+                print(f"MammaMia: {self.name} is healthy again, closing its circuit")
+            self.state = "closed"
+            self.open_seconds = self.base_open_seconds
+            self.probing = False
+            return
+        self.consecutive_failures += 1
+        self.last_error = error
+        if self.state == "half_open":
+            self.open_seconds = min(self.open_seconds * 2, self.base_open_seconds * 16)
+            self.trip()
+        elif self.consecutive_failures >= self.failures or (len(self.outcomes) >= self.failures * 2 and self.error_rate() > 0.8):
+            self.trip()
+
+    def trip(self):
+        print(f"MammaMia: {self.name} keeps failing, skipping it for {self.open_seconds}s")
+        self.state = "open"
+        self.opened_at = time.time()
+        self.probing = False
+
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def score(self):
+        '''1 is a fast healthy provider, 0 a dead one'''
+        if self.state == "open":
+            return 0.0
+        speed = 1.0 if self.latency is None else 1 / (1 + self.latency / 10)
+        return round((1 - self.error_rate()) * speed, 3)
+
+    def snapshot(self):
+        return {
+            "state": self.state,
+            "score": self.score(),
+            "error_rate": round(self.error_rate(), 3),
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "consecutive_failures": self.consecutive_failures,
+            "calls": len(self.outcomes),
+            "retry_in": max(0, round(self.opened_at + self.open_seconds - time.time(), 1)) if self.state == "open" else 0,
+            "last_error": self.last_error
+        }
+
+
+breakers = {}
+
+def get_breaker(name):
+    breaker = breakers.get(name)
+    if breaker is None:
+        breaker = breakers[name] = CircuitBreaker(name)
+    return breaker
+
+def note_upstream_error():
+    '''Called by the shared client on transport errors and 5xx answers'''
+    call = current_call.get()
+    if call is not None:
+        call["errors"] += 1
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import re
+import time
+from collections import OrderedDict
+from urllib.parse import unquote
+
+
+def estimate_size(value):
+    '''
+    Rough size in bytes of a cached value, good enough to enforce a memory cap
+    '''
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    try:
+        return len(json.dumps(value, default=str))
+    except Exception:
+        return len(repr(value))
+
+
+class TTLCache:
+    '''
+    In-memory LRU cache where every entry has its own TTL.
+    After the TTL an entry is stale: it can still be served for stale_ttl seconds
+    while a refresh runs in the background (stale-while-revalidate).
+    The cache is bounded both by number of entries and by an estimated memory size.
+    '''
+    def __init__(self, max_entries=1000, max_bytes=None, stale_ttl=0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stale_ttl = stale_ttl
+        self.entries = OrderedDict()
+        self.size = 0
+        self.refreshing = {}
+
+    def lookup(self, key):
+        '''Return (value, fresh). value is None when the key is missing or too old to be served'''
+        entry = self.entries.get(key)
+        if entry is None:
+            return None, False
+        value, expires_at, stale_until, size = entry
+        now = time.time()
+        if now >= stale_until:
+            self.pop(key)
+            return None, False
+        self.entries.move_to_end(key)
+        return value, now < expires_at
+
+    def get(self, key):
+        '''Return the value only while it is fresh'''
+        value, fresh = self.lookup(key)
+        return value if fresh else None
+
+    def set(self, key, value, ttl, stale_ttl=None):
+        if ttl <= 0:
+            return
+        if stale_ttl is None:
+            stale_ttl = self.stale_ttl
+        self.pop(key)
+        size = estimate_size(value)
+        if self.max_bytes and size > self.max_bytes:
+            return
+        now = time.time()
+        self.entries[key] = (value, now + ttl, now + ttl + stale_ttl, size)
+        self.size += size
+        self.evict()
+
+    def pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[3]
+        return entry
+
+    def evict(self):
+        while self.entries and (len(self.entries) > self.max_entries or (self.max_bytes and self.size > self.max_bytes)):
+            key, entry = self.entries.popitem(last=False)
+            self.size -= entry[3]
+
+    def ttl_left(self, key):
+        '''Seconds before the entry turns stale, None when missing'''
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        return entry[1] - time.time()
+
+    def schedule_refresh(self, key, factory):
+        '''
+        Run factory() in the background to refresh key, at most once at a time per key.
+        factory must return a coroutine that stores the new value itself.
+        '''
+        if key in self.refreshing:
+            return self.refreshing[key]
+        task = asyncio.ensure_future(factory())
+        self.refreshing[key] = task
+        task.add_done_callback(lambda _: self.refreshing.pop(key, None))
+        return task
+
+
+def url_expiry(url):
+    '''
+    Earliest "expires" timestamp (seconds) embedded in a URL, also inside an encoded destination
+    like the MFP ?d= parameter. None if the URL carries no expiring token.
+    '''
+    if not url:
+        return None
+    values = [int(value) for value in re.findall(r'[?&]expires=(\d+)', unquote(str(url)))]
+    if not values:
+        return None
+    #Some hosts use milliseconds
+    return min(value / 1000 if value > 10**11 else value for value in values)
+
+
+def expiring_ttl(urls, ttl, stale_ttl, margin=120):
+    '''
+    Cap ttl and stale_ttl so a cached entry is never served after the earliest token in urls expires.
+    The entry turns stale 2*margin seconds before expiry and is dropped margin seconds before it.
+    '''
+    expiries = [expiry for expiry in (url_expiry(url) for url in urls) if expiry]
+    if not expiries:
+        return ttl, stale_ttl
+    left = min(expiries) - time.time()
+    return min(ttl, left - 2 * margin), min(stale_ttl, margin)
@@ -0,0 +1,80 @@
+import asyncio
+import json
+from curl_cffi.requests import AsyncSession, RequestsError
+import Src.Utilities.config as config
+from Src.Utilities.ratelimit import throttle, host_key
+from Src.Utilities.breaker import note_upstream_error
+
+Max_Clients = int(config.Max_Clients)
+Max_Host_Connections = int(config.Max_Host_Connections)
+
+
+class PooledClient:
+    '''
+    Long-lived AsyncSession shared by every request that uses the same impersonation profile and proxies.
+    Keeping it open lets curl reuse TLS sessions, HTTP/2 connections and DNS results between requests.
+    Concurrent requests to the same upstream host are capped so one slow site can't take every connection,
+    and every request to a scraped site waits for the token bucket of its host (see ratelimit.py).
+    It exposes the same get/post/head/request methods as AsyncSession, so providers use it unchanged.
+    '''
+    def __init__(self, impersonate=None, proxies=None):
+        self.impersonate = impersonate
+        self.proxies = proxies or {}
+        self.session = AsyncSession(impersonate=impersonate, proxies=self.proxies, max_clients=Max_Clients)
+        self.hosts = {}
+
+    def host_limit(self, url):
+        host = host_key(url)
+        semaphore = self.hosts.get(host)
+        if semaphore is None:
+            semaphore = self.hosts[host] = asyncio.Semaphore(Max_Host_Connections)
+        return semaphore
+
+    async def request(self, method, url, **kwargs):
+        await throttle(url)
+        async with self.host_limit(url):
+            try:
+                response = await self.session.request(method, url, **kwargs)
+            except RequestsError:
+                note_upstream_error()
+                raise
+        if response.status_code >= 500:
+            note_upstream_error()
+        return response
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def head(self, url, **kwargs):
+        return await self.request("HEAD", url, **kwargs)
+
+    async def close(self):
+        await self.session.close()
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+
+pools = {}
+
+def get_client(impersonate=None, proxies=None):
+    '''
+    Shared client for an impersonation profile and proxy configuration, created on first use
+    '''
+    key = (impersonate, json.dumps(proxies or {}, sort_keys=True))
+    client = pools.get(key)
+    if client is None:
+        client = pools[key] = PooledClient(impersonate, proxies)
+    return client
+
+async def close_clients():
+    clients = list(pools.values())
+    pools.clear()
+    for client in clients:
+        try:
+            await client.close()
+        except Exception as e:
+            print(f"MammaMia: Failed closing client, {e}")
@@ -1,5 +1,6 @@
 #LOAD THE CONFIG
 import json
+from urllib.parse import urlparse
 
 # Open the configuration file
 with open('config.json') as f:
@@ -71,6 +72,9 @@ TF_PROXY = SITE['Tantifilm']["TF_PROXY"]
 CB_PROXY = SITE['CB01']["CB_PROXY"]
 SC_PROXY = SITE['StreamingCommunity']["SC_PROXY"]
 VX_PROXY = SITE['StreamingCommunity']["VX_PROXY"]
+#With MFP, extract the VixCloud playlist here instead of asking the MFP extractor. Off by default: VixCloud tokens
+#may be bound to the IP that extracted them, and with MFP playback comes from another host
+SC_LOCAL_EXTRACTOR = SITE['StreamingCommunity'].get("SC_LOCAL_EXTRACTOR", "0")
 AW_PROXY = SITE['AnimeWorld']["AW_PROXY"]
 MX_PROXY = SITE['CB01']["MX_PROXY"]
 OST_PROXY = SITE['Onlineserietv']["OST_PROXY"]
@@ -87,6 +91,7 @@ ips4_member_id = SITE['DDLStream']['cookies']["ips4_member_id"]
 ips4_login_key = SITE['DDLStream']['cookies']["ips4_login_key"]
 
 #General
+#Settings added after the first release are read with their default, so an older config.json keeps working
 GENERAL = config['General']
 dotenv = GENERAL["load_env"]
 HOST = GENERAL["HOST"]
@@ -96,3 +101,61 @@ Name = GENERAL["Name"]
 Public_Instance = GENERAL["Public_Instance"]
 Remote_Instance = GENERAL["Remote_Instance"]
 Global_Proxy = GENERAL["Global_Proxy"]
+
+#Timeout (seconds) of every provider in addon_stream, a site can override it with its own "timeout" key
+Provider_Timeout = GENERAL.get("Provider_Timeout", "20")
+SITE_TIMEOUT = {name: float(site.get("timeout", Provider_Timeout)) for name, site in SITE.items()}
+
+#Progressive stream mode: answer once N streams are collected or the deadline (seconds) passes, 0 disables it
+Stream_First_N = GENERAL.get("Stream_First_N", "0")
+Stream_Deadline = GENERAL.get("Stream_Deadline", "0")
+
+#Stream result cache: TTL and stale window in seconds, memory cap in MB. A site can override the TTL with "cache_ttl"
+Stream_Cache_TTL = GENERAL.get("Stream_Cache_TTL", "1800")
+Stream_Cache_Stale = GENERAL.get("Stream_Cache_Stale", "300")
+Stream_Cache_MB = GENERAL.get("Stream_Cache_MB", "32")
+SITE_CACHE_TTL = {name: float(site.get("cache_ttl", Stream_Cache_TTL)) for name, site in SITE.items()}
+
+#Metadata cache (TMDB/Kitsu lookups): TTL in seconds and SQLite file that keeps it across restarts
+Metadata_Cache_TTL = GENERAL.get("Metadata_Cache_TTL", "604800")
+Cache_DB = GENERAL.get("Cache_DB", "mammamia_cache.db")
+
+#Shared HTTP clients: concurrent transfers per client and concurrent requests per upstream host
+Max_Clients = GENERAL.get("Max_Clients", "50")
+Max_Host_Connections = GENERAL.get("Max_Host_Connections", "10")
+
+#Token bucket of each scraped site host: requests per second and burst. A site can set its own with "rate_limit": {"rate", "burst"}
+#Other hosts (playlists, keys, TMDB/Kitsu, MFP, CDN edges) aren't throttled
+Rate_Limit = GENERAL.get("Rate_Limit", "10")
+Rate_Burst = GENERAL.get("Rate_Burst", "20")
+SITE_RATE_LIMITS = {}
+RATE_LIMITS = {}
+for name, site in SITE.items():
+    limit = site.get("rate_limit", {"rate": Rate_Limit, "burst": Rate_Burst})
+    SITE_RATE_LIMITS[name] = (float(limit["rate"]), float(limit["burst"]))
+    if "url" in site:
+        host = urlparse(site["url"]).netloc.lower()
+        host = host[4:] if host.startswith("www.") else host
+        RATE_LIMITS[host] = SITE_RATE_LIMITS[name]
+
+#Circuit breaker: failures in a row before a provider is skipped, and for how many seconds
+Breaker_Failures = GENERAL.get("Breaker_Failures", "5")
+Breaker_Open_Seconds = GENERAL.get("Breaker_Open_Seconds", "60")
+
+#HLS proxy playlist cache: TTL in seconds for live and VOD/master playlists, memory cap in MB
+Playlist_Live_TTL = GENERAL.get("Playlist_Live_TTL", "2")
+Playlist_VOD_TTL = GENERAL.get("Playlist_VOD_TTL", "600")
+Playlist_Cache_MB = GENERAL.get("Playlist_Cache_MB", "16")
+
+#Seconds the vixcloud enc.key is served from memory before it's revalidated in the background
+Key_Cache_TTL = GENERAL.get("Key_Cache_TTL", "3600")
+
+#VixCloud CDN edges: comma separated candidates (more are discovered from playlists), probe interval in seconds
+#and how many of the fastest healthy edges share the traffic
+CDN_Edges = GENERAL.get("CDN_Edges", "sc-u12-01.scws-content.net")
+Edge_Probe_Interval = GENERAL.get("Edge_Probe_Interval", "60")
+Edge_Top = GENERAL.get("Edge_Top", "3")
+
+#Background renewal of expiring stream tokens: refreshes per minute, and how popular (decayed hits) a title must be
+Token_Refresh_Budget = GENERAL.get("Token_Refresh_Budget", "10")
+Token_Refresh_Min_Hits = GENERAL.get("Token_Refresh_Min_Hits", "2")
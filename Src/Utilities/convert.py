@@ -1,11 +1,26 @@
 from Src.Utilities.loadenv import load_env
+from Src.Utilities.metacache import metadata_cache
 env_vars = load_env()
 
 TMDB_KEY = env_vars.get('TMDB_KEY')
-async def get_TMDb_id_from_IMDb_id(imdb_id,client):
+async def tmdb_find(imdb_id,client):
+    '''
+    TMDB /find response for an IMDb id, shared by every provider through the metadata cache.
+    It is always asked in italian since the same response is used for titles and ids.
+    '''
+    key = f"tmdb_find:{imdb_id}"
+    data = metadata_cache.get(key)
+    if data is not None:
+        return data
     response = await client.get(f'https://api.themoviedb.org/3/find/{imdb_id}', 
-                            params={'external_source': 'imdb_id', 'api_key': f'{TMDB_KEY}'})
-    tmbda = response.json()
+                            params={'external_source': 'imdb_id', 'api_key': f'{TMDB_KEY}', 'language': 'it'})
+    data = response.json()
+    #Don't remember misses, the title could be added to TMDB later
+    if data.get('movie_results') or data.get('tv_results'):
+        metadata_cache.set(key, data)
+    return data
+async def get_TMDb_id_from_IMDb_id(imdb_id,client):
+    tmbda = await tmdb_find(imdb_id,client)
     if tmbda['movie_results']:
         return tmbda['movie_results'][0]['id']
     elif tmbda['tv_results']:
@@ -13,12 +28,17 @@ async def get_TMDb_id_from_IMDb_id(imdb_id,client):
     else:
         return None
 async def get_IMDB_id_from_TMDb_id(tmdb_id,client):
+    key = f"tmdb_imdb:{tmdb_id}"
+    imdb_id = metadata_cache.get(key)
+    if imdb_id is not None:
+        return imdb_id
     url = f"https://api.themoviedb.org/3/movie/{tmdb_id}?api_key={TMDB_KEY}"
     response = await client.get(url)
     if response.status_code == 200:
         data = response.json()
         imdb_id = data.get('imdb_id')
         if imdb_id:
+            metadata_cache.set(key, imdb_id)
             return imdb_id
 
 
@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+
+class CookieJar:
+    '''
+    Cookies of one site shared by every request to it, each with its own expiry.
+    When the site challenges a request, refresh() gets new cookies once: concurrent requests wait on the lock
+    and reuse what the first one obtained instead of each solving the challenge again.
+    '''
+    def __init__(self, name, ttl=None, cookies=None):
+        self.name = name
+        self.ttl = ttl
+        self.cookies = {}
+        self.version = 0
+        self.lock = asyncio.Lock()
+        if cookies:
+            #Cookies from config.json never expire on our side
+            for key, value in cookies.items():
+                self.set(key, value, ttl=0)
+
+    def set(self, key, value, ttl=None):
+        '''ttl None uses the jar default, 0 means no expiry'''
+        if ttl is None:
+            ttl = self.ttl
+        self.cookies[key] = (value, time.time() + ttl if ttl else None)
+
+    def update(self, cookies, ttl=None):
+        for key, value in cookies.items():
+            self.set(key, value, ttl)
+        self.version += 1
+
+    def get(self):
+        now = time.time()
+        for key in [key for key, (value, expires) in self.cookies.items() if expires and expires <= now]:
+            del self.cookies[key]
+        return {key: value for key, (value, expires) in self.cookies.items()}
+
+    def absorb(self, response):
+        '''Keep the cookies the site set on a response, with their own expiry'''
+        jar = getattr(getattr(response, 'cookies', None), 'jar', None)
+        if jar is None:
+            return
+        now = time.time()
+        for cookie in jar:
+            if cookie.expires is None:
+                self.set(cookie.name, cookie.value)
+            elif cookie.expires > now:
+                self.set(cookie.name, cookie.value, cookie.expires - now)
+
+    async def refresh(self, fetch, seen_version):
+        '''
+        Replace the cookies with the ones returned by fetch(), a coroutine function.
+        seen_version is jar.version when the challenged request was sent: if the jar changed since then,
+        another request already refreshed it and its cookies are returned without calling fetch.
+        '''
+        async with self.lock:
+            if self.version == seen_version:
+                cookies = await fetch()
+                if cookies:
+                    self.cookies.clear()
+                    self.update(cookies)
+            return self.get()
+
+
+jars = {}
+
+def get_jar(name, ttl=None, cookies=None):
+    '''Shared jar of a site, created on first use'''
+    jar = jars.get(name)
+    if jar is None:
+        jar = jars[name] = CookieJar(name, ttl, cookies)
+    return jar
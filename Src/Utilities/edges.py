@@ -0,0 +1,105 @@
+import asyncio
+import random
+import re
+import time
+from collections import deque
+import Src.Utilities.config as config
+from Src.Utilities.clients import get_client
+
+DEFAULT_EDGE = "sc-u12-01.scws-content.net"
+EDGE_HOST = re.compile(r"https://(sc-[a-zA-Z0-9]+-\d+\.scws-content\.net)")
+EDGE_SEGMENT = re.compile(r"https://sc-[a-zA-Z0-9]+-\d+\.scws-content\.net(/[^\s\"]+)")
+Edge_Probe_Interval = float(config.Edge_Probe_Interval)
+Edge_Top = int(config.Edge_Top)
+MAX_EDGES = 50
+
+
+class Edge:
+    '''A CDN edge with its probe history: average latency and the last outcomes'''
+    def __init__(self, host):
+        self.host = host
+        self.latency = None
+        self.outcomes = deque(maxlen=10)
+        self.last_probe = 0
+        self.last_error = None
+        self.picked = 0
+
+    @property
+    def healthy(self):
+        #The last probe must have worked and at most half of the recent ones failed
+        return bool(self.outcomes) and self.outcomes[-1] and sum(self.outcomes) * 2 >= len(self.outcomes)
+
+    def record(self, success, latency=None, error=None):
+        self.outcomes.append(success)
+        self.last_probe = time.time()
+        if success:
+            self.latency = latency if self.latency is None else 0.7 * self.latency + 0.3 * latency
+        else:
+            self.last_error = error
+
+    def snapshot(self):
+        return {
+            "healthy": self.healthy,
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "success_rate": round(sum(self.outcomes) / len(self.outcomes), 2) if self.outcomes else None,
+            "picked": self.picked,
+            "last_probe": int(self.last_probe),
+            "last_error": self.last_error
+        }
+
+
+edges = {}
+#Path of a segment from a recent playlist: probes ask every edge for it, like a player would
+sample_segment = None
+
+def add_edge(host):
+    if host not in edges and len(edges) < MAX_EDGES:
+        edges[host] = Edge(host)
+
+for host in [DEFAULT_EDGE, *(host.strip() for host in config.CDN_Edges.split(",") if host.strip())]:
+    add_edge(host)
+
+def discover(m3u8_content):
+    '''Edges found in upstream playlists become candidates too'''
+    global sample_segment
+    for host in set(EDGE_HOST.findall(m3u8_content)):
+        add_edge(host)
+    segment = EDGE_SEGMENT.search(m3u8_content)
+    if segment:
+        sample_segment = segment.group(1)
+
+def pick():
+    '''
+    Edge for one request: a weighted random choice among the Edge_Top fastest healthy edges,
+    so the load is spread but the faster ones get more of it. Until a probe succeeds it's DEFAULT_EDGE.
+    '''
+    best = sorted((edge for edge in edges.values() if edge.healthy), key=lambda edge: edge.latency)[:Edge_Top]
+    if not best:
+        return DEFAULT_EDGE
+    edge = random.choices(best, weights=[1 / max(edge.latency, 0.01) for edge in best])[0]
+    edge.picked += 1
+    return edge.host
+
+async def probe(edge, segment):
+    #Players download the segments directly from the edge, so no proxy here.
+    #Only an edge that really serves the segment is healthy: 403/404 edges get no traffic
+    client = get_client()
+    start = time.time()
+    try:
+        response = await client.get(f"https://{edge.host}{segment}", headers={"Range": "bytes=0-0"}, timeout=5)
+        if 200 <= response.status_code < 300:
+            edge.record(True, time.time() - start)
+        else:
+            edge.record(False, error=f"HTTP {response.status_code}")
+    except Exception as e:
+        edge.record(False, error=str(e))
+
+async def probe_loop():
+    while True:
+        #Until a playlist has gone through /clony there's nothing to probe and DEFAULT_EDGE is used
+        if sample_segment:
+            await asyncio.gather(*(probe(edge, sample_segment) for edge in list(edges.values())))
+        await asyncio.sleep(Edge_Probe_Interval)
+
+def status():
+    return {host: edge.snapshot() for host, edge in edges.items()}
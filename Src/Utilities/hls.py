@@ -0,0 +1,182 @@
+import re
+
+ATTRIBUTE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def parse_attributes(text):
+    '''EXT-X tag attributes, values are kept raw (quoted strings keep their quotes) so they dump back unchanged'''
+    return {name: value for name, value in ATTRIBUTE.findall(text)}
+
+def dump_attributes(attributes):
+    return ",".join(f"{name}={value}" for name, value in attributes.items())
+
+
+class Tagged:
+    '''An EXT-X tag with attributes, optionally pointing to a URI'''
+    __slots__ = ("tag", "attributes")
+
+    def __init__(self, tag, attributes):
+        self.tag = tag
+        self.attributes = attributes
+
+    def get(self, name, default=None):
+        value = self.attributes.get(name)
+        if value is None:
+            return default
+        return value.strip('"')
+
+    @property
+    def uri(self):
+        return self.get("URI")
+
+    def dump(self, rewrite_uri=None):
+        if rewrite_uri and "URI" in self.attributes:
+            attributes = dict(self.attributes)
+            attributes["URI"] = f'"{rewrite_uri(self.uri)}"'
+        else:
+            attributes = self.attributes
+        return f"{self.tag}:{dump_attributes(attributes)}"
+
+
+class Media(Tagged):
+    '''#EXT-X-MEDIA: an alternative audio/subtitle rendition of a group'''
+    __slots__ = ()
+
+    @property
+    def type(self):
+        return self.get("TYPE")
+
+
+class Key(Tagged):
+    '''#EXT-X-KEY, modelled so its URI is rewritten like the others'''
+    __slots__ = ()
+
+
+class Variant(Tagged):
+    '''#EXT-X-STREAM-INF and the URI on the next line'''
+    __slots__ = ("location",)
+
+    def __init__(self, tag, attributes, location=None):
+        super().__init__(tag, attributes)
+        self.location = location
+
+    @property
+    def uri(self):
+        return self.location
+
+    @property
+    def height(self):
+        resolution = self.get("RESOLUTION")
+        if resolution and "x" in resolution:
+            return int(resolution.split("x")[1])
+        return None
+
+    def dump(self, rewrite_uri=None):
+        uri = rewrite_uri(self.location) if rewrite_uri else self.location
+        return f"{self.tag}:{dump_attributes(self.attributes)}\n{uri}"
+
+
+class Segment:
+    '''Media segment URI'''
+    __slots__ = ("uri",)
+
+    def __init__(self, uri):
+        self.uri = uri
+
+    def dump(self, rewrite_uri=None):
+        return rewrite_uri(self.uri) if rewrite_uri else self.uri
+
+
+class Playlist:
+    '''
+    Compact model of a master or media playlist.
+    items keeps the playlist order: plain strings for lines we don't model (they dump back unchanged)
+    and Variant/Media/Key/Segment objects for the rest, so filtering and rewriting are a single pass.
+    '''
+    def __init__(self):
+        self.items = []
+        self.variants = []
+        self.media = []
+
+    def drop_variants(self, predicate):
+        '''Remove the variants matching predicate, unless that would leave none'''
+        keep = [variant for variant in self.variants if not predicate(variant)]
+        if not keep or len(keep) == len(self.variants):
+            return
+        dropped = set(map(id, self.variants)) - set(map(id, keep))
+        self.variants = keep
+        self.items = [item for item in self.items if id(item) not in dropped]
+
+    def drop_media(self, media_type):
+        '''Remove a rendition type (AUDIO, SUBTITLES...) and the references to its groups in the variants'''
+        dropped = [media for media in self.media if media.type == media_type]
+        if not dropped:
+            return
+        ids = set(map(id, dropped))
+        self.media = [media for media in self.media if id(media) not in ids]
+        self.items = [item for item in self.items if id(item) not in ids]
+        for variant in self.variants:
+            variant.attributes.pop(media_type, None)
+
+    def dump(self, rewrite_uri=None):
+        '''Playlist text, rewrite_uri(uri) is applied to every variant, media, key and segment URI'''
+        lines = [item if isinstance(item, str) else item.dump(rewrite_uri) for item in self.items]
+        return "\n".join(lines) + "\n"
+
+
+def parse(text):
+    playlist = Playlist()
+    items = playlist.items
+    variant = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line[0] != "#":
+            if variant is not None:
+                variant.location = line
+                variant = None
+            else:
+                items.append(Segment(line))
+            continue
+        #Segment durations are most of a VOD playlist, keep them as they are without splitting the tag
+        if line.startswith("#EXTINF:"):
+            items.append(line)
+            continue
+        tag, _, value = line.partition(":")
+        if tag == "#EXT-X-STREAM-INF":
+            variant = Variant(tag, parse_attributes(value))
+            playlist.variants.append(variant)
+            items.append(variant)
+        elif tag == "#EXT-X-MEDIA":
+            media = Media(tag, parse_attributes(value))
+            playlist.media.append(media)
+            items.append(media)
+        elif tag == "#EXT-X-KEY":
+            items.append(Key(tag, parse_attributes(value)))
+        else:
+            items.append(line)
+    return playlist
+
+
+if __name__ == "__main__":
+    #Benchmark: the model path against the old regex over the whole body, on a long VOD playlist
+    import timeit
+    CDN = re.compile(r"https://sc-[a-zA-Z0-9]+-\d+.scws-content.net")
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:4", "#EXT-X-PLAYLIST-TYPE:VOD",
+             '#EXT-X-KEY:METHOD=AES-128,URI="https://vixcloud.co/storage/enc.key",IV=0x43A6D967D5C17290D98322F5C8F6660B']
+    for i in range(20000):
+        lines += ["#EXTINF:4.004,", f"https://sc-b1-03.scws-content.net/hls/1/abc/video/720p/{i:04}-0000.ts"]
+    lines.append("#EXT-X-ENDLIST")
+    body = "\n".join(lines) + "\n"
+
+    def regex_path():
+        return CDN.sub("https://sc-u12-01.scws-content.net", body)
+
+    def model_path():
+        return parse(body).dump(lambda uri: CDN.sub("https://sc-u12-01.scws-content.net", uri))
+
+    assert regex_path() == model_path()
+    for name, function in (("regex", regex_path), ("model", model_path)):
+        seconds = min(timeit.repeat(function, number=10, repeat=3)) / 10
+        print(f"{name}: {seconds * 1000:.2f} ms per playlist ({len(body) // 1024} KB, 20000 segments)")
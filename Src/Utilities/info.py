@@ -2,29 +2,62 @@ from Src.Utilities.loadenv import load_env
 from tmdbv3api import TMDb, Movie, TV
 from Src.Utilities.convert_date import convert_US_date, convert_IT_date
 import Src.Utilities.config as config
+from Src.Utilities.convert import tmdb_find
+from Src.Utilities.metacache import metadata_cache
+from Src.Utilities.singleflight import SingleFlight
+import asyncio
 import json
 env_vars = load_env()
 TMDB_KEY = env_vars.get('TMDB_KEY')
 
 
-def get_info_tmdb(tmbda,ismovie,type):
+tmdb_flight = SingleFlight()
+
+async def get_tmdb_details(tmbda,ismovie):
+    '''
+    Title and full release date of a TMDB id, from the metadata cache when possible.
+    tmdbv3api is blocking, so the lookup runs in a thread, once for all the providers asking at the same time
+    '''
+    key = f"tmdb_details:{ismovie}:{tmbda}"
+    details = metadata_cache.get(key)
+    if details is not None:
+        return details['name'],details['date']
+    return await tmdb_flight.do(key, lambda: load_tmdb_details(tmbda,ismovie,key))
+
+async def load_tmdb_details(tmbda,ismovie,key):
+    showname,full_date = await asyncio.to_thread(fetch_tmdb_details,tmbda,ismovie)
+    #Stored here, on the event loop: the in-memory tier of the cache isn't thread safe
+    metadata_cache.set(key, {'name': showname, 'date': full_date})
+    return showname,full_date
+
+def fetch_tmdb_details(tmbda,ismovie):
     tmdb = TMDb()
     tmdb.api_key = f'{TMDB_KEY}'
     tmdb.language = 'it'
     if ismovie == 0:
-        tv = TV()
-        show= tv.details(tmbda)
+        show = TV().details(tmbda)
         showname = show.name
+        full_date = show.first_air_date
+    else:
+        show = Movie().details(tmbda)
+        showname = show.title
+        full_date = show.release_date
+    return showname,full_date
+
+
+async def get_info_tmdb(tmbda,ismovie,type):
+    if ismovie == 0:
+        showname,first_air_date = await get_tmdb_details(tmbda,ismovie)
         if type == "Filmpertutti":
             return showname
         elif type == "StreamingCommunity":
-            full_date = show.first_air_date
+            full_date = first_air_date
             date = full_date.split("-")[0]
             return showname,date
         elif type == "StreamingCommunityFS":
                 return showname
         elif type == "Tantifilm":
-            date = show.first_air_date
+            date = first_air_date
             date = date.split("-")[0]
             return showname,date
         elif type == "TantifilmFS":
@@ -32,43 +65,41 @@ def get_info_tmdb(tmbda,ismovie,type):
         elif type == "Cool":
             return showname
         elif type == "LordChannel":
-            date = show.first_air_date
+            date = first_air_date
             date = date.split("-")[0]
             return showname,date
         elif type == "StreamingWatch":
-            date = show.first_air_date
+            date = first_air_date
             date = date.split("-")[0]
             return showname,date
         elif type == "DDLStream":
             return showname
         elif type == "Cb01":
-            date = show.first_air_date
+            date = first_air_date
             date = date.split("-")[0]
             return showname,date
         elif type == "Whvx":
-            date = show.first_air_date
+            date = first_air_date
             date = date.split("-")[0]
             return showname,date
         elif type == "Guardaserie":
-            date = show.first_air_date
+            date = first_air_date
             date = date.split("-")[0]
             return showname,date
     
     elif ismovie == 1:
-        movie = Movie()
-        show= movie.details(tmbda)
-        showname= show.title
+        showname,release_date = await get_tmdb_details(tmbda,ismovie)
         #Get all release dates
         if type == "Filmpertutti":
             return showname
         elif type == "StreamingCommunity":
-            date = show.release_date
+            date = release_date
             date = date.split("-")[0]
             return showname,date
         elif type == "StreamingCommunityFS":
             return showname
         elif type == "Tantifilm":
-            date = show.release_date
+            date = release_date
             date = date.split("-")[0]
             return showname,date
         elif type == "TantifilmFS":
@@ -76,27 +107,26 @@ def get_info_tmdb(tmbda,ismovie,type):
         elif type == "Cool":
             return showname
         elif type == "LordChannel":
-            date = show.release_date
+            date = release_date
             date = date.split("-")[0]
             return showname,date
         elif type == "StreamingWatch":
-            date = show.release_date
+            date = release_date
             date = date.split("-")[0]
             return showname,date
         elif type == "DDLStream":
             return showname
         elif type == "Cb01":
-            date = show.release_date
+            date = release_date
             date = date.split("-")[0]
             return showname,date
         elif type == "Whvx":
-            date = show.release_date
+            date = release_date
             date = date.split("-")[0]
             return showname,date
 
 async def get_info_imdb(imdb_id, ismovie, type,client):
-    resp = await client.get(f'https://api.themoviedb.org/3/find/{imdb_id}?api_key={TMDB_KEY}&language=it&external_source=imdb_id')
-    data = resp.json()
+    data = await tmdb_find(imdb_id,client)
     if ismovie == 0:
         showname = data['tv_results'][0]['name']
         if type == "Filmpertutti":
@@ -167,6 +197,10 @@ async def get_info_imdb(imdb_id, ismovie, type,client):
 
 
 async def get_info_kitsu(kitsu_id,client):
+    key = f"kitsu:{kitsu_id}"
+    info = metadata_cache.get(key)
+    if info is not None:
+        return info['name'],info['date']
     api_url = f'https://kitsu.io/api/edge/anime/{kitsu_id}'
     response = await client.get(api_url)
     data = json.loads(response.text)
@@ -175,6 +209,7 @@ async def get_info_kitsu(kitsu_id,client):
     except Exception as e:
         showname = data['data']['attributes']['canonicalTitle']
     date = data['data']['attributes']['startDate']
+    metadata_cache.set(key, {'name': showname, 'date': date})
     return showname,date           
 
 
@@ -1,13 +1,19 @@
-from urllib.parse import urlparse, parse_qs,unquote,quote
+from urllib.parse import urlparse, parse_qs,unquote,quote,urlencode,parse_qsl
 from fastapi import APIRouter, HTTPException, Response, Request
-from curl_cffi.requests import AsyncSession
 import Src.Utilities.config as config
+from Src.Utilities.clients import get_client
+from Src.Utilities.cache import TTLCache, expiring_ttl
+from Src.Utilities.singleflight import SingleFlight
+from Src.Utilities import hls
+from Src.Utilities import edges
 from Src.Utilities.loadenv import load_env  
 env_vars = load_env()
 SC_PROXY = config.SC_PROXY
 VX_PROXY = config.VX_PROXY
 import json        
 import re
+import asyncio
+import time
 
 import random
 proxies = {}
@@ -53,10 +59,50 @@ router = APIRouter()
 User_Agent= "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:127.0) Gecko/20100101 Firefox/127.0"
 async def fetch_m3u8(url):
     """Fetch the M3U8 file from the URL and store it in memory."""
-    async with AsyncSession() as client:
-        response = await client.get(ForwardProxy + url,headers = {"User-Agent": User_Agent, "user-agent": User_Agent}, proxies = proxies2)
-        response.raise_for_status()  # Raise an error for bad responses
-        return response.text
+    client = get_client(proxies=proxies2)
+    response = await client.get(ForwardProxy + url,headers = {"User-Agent": User_Agent, "user-agent": User_Agent})
+    response.raise_for_status()  # Raise an error for bad responses
+    return response.text
+
+#Rewritten playlists, shared by every player polling the same upstream URL
+Playlist_Live_TTL = float(config.Playlist_Live_TTL)
+Playlist_VOD_TTL = float(config.Playlist_VOD_TTL)
+playlist_cache = TTLCache(max_entries=2000, max_bytes=int(config.Playlist_Cache_MB) * 1024 * 1024)
+playlist_flight = SingleFlight()
+
+def normalize_url(url):
+    '''Same upstream URL whatever the order of its query parameters'''
+    parsed = urlparse(url)
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return parsed._replace(query=query, fragment="").geturl()
+
+def playlist_ttl(content, url):
+    '''
+    Live media playlists change every target duration, VOD (#EXT-X-ENDLIST) and master playlists don't.
+    The TTL never goes past the expires token of the upstream URL.
+    '''
+    if "#EXT-X-ENDLIST" in content or "#EXT-X-STREAM-INF" in content:
+        ttl = Playlist_VOD_TTL
+    else:
+        ttl = Playlist_Live_TTL
+    ttl, _ = expiring_ttl([url], ttl, 0, margin=30)
+    return ttl
+
+async def load_playlist(key, url, rewrite):
+    content = await fetch_m3u8(url)
+    body = rewrite(content)
+    playlist_cache.set(key, body, playlist_ttl(content, url))
+    return body
+
+async def cached_playlist(key, url, rewrite):
+    '''
+    Rewritten playlist for url: from the cache, or fetched once for all the concurrent pollers.
+    Failures are never cached.
+    '''
+    body = playlist_cache.get(key)
+    if body is not None:
+        return body
+    return await playlist_flight.do(key, lambda: load_playlist(key, url, rewrite))
 
 @router.get("/clone/manifest.m3u8")
 async def clone_m3u8(d: str = None):
@@ -82,8 +128,8 @@ async def clone2_m3u8(d:str,token:str,expires:str,h:str = None, b:str = None, re
         forwarded_proto = request.headers.get("x-forwarded-proto")
         scheme = forwarded_proto if forwarded_proto else request.url.scheme
         instance_url = f"{scheme}://{request.url.netloc}"
-        m3u8_content = await fetch_m3u8(m3u8)
-        modified_playlist = m3u8_content.replace("https://vixcloud.co/playlist/", f"{instance_url}/clony/")
+        key = ("vixcloud", normalize_url(m3u8), instance_url)
+        modified_playlist = await cached_playlist(key, m3u8, lambda content: rewrite_master(content, instance_url))
 
         return Response(content=modified_playlist, media_type='application/vnd.apple.mpegurl')
     except Exception as e:
@@ -98,28 +144,102 @@ async def clony_m3u8(segment: str, request: Request):
     if "rendition=1080p" in full_url or "type=subtitle" in full_url:
         print(full_url)
         raise HTTPException(status_code=404, detail="Requested variant not available.")
-    m3u8_content = await fetch_m3u8(full_url)
-    if "sc-u12" not  in m3u8_content:
-        m3u8_content = re.sub(r"https://sc-[a-zA-Z0-9]+-\d+.scws-content.net", "https://sc-u12-01.scws-content.net", m3u8_content)
+    #The upstream body is fetched and cached once per URL, whatever edge each player gets
+    key = ("clony", normalize_url(full_url))
+    m3u8_content = await cached_playlist(key, full_url, discover_edges)
+    m3u8_content = edge_playlist(key, m3u8_content, edges.pick())
     return Response(content=m3u8_content, media_type='application/vnd.apple.mpegurl')
+
+@router.get("/health/edges")
+async def health_edges():
+    return edges.status()
+
+CDN_HOST = re.compile(r"https://sc-[a-zA-Z0-9]+-\d+.scws-content.net")
+
+def rejected_variant(variant):
+    return (variant.height or 0) >= 1080 or "rendition=1080p" in (variant.uri or "")
+
+def rewrite_master(m3u8_content, instance_url):
+    '''
+    Drop the renditions /clony refuses (1080p and subtitles) from the master playlist,
+    so players never ask for them, and point the remaining ones to /clony.
+    '''
+    playlist = hls.parse(m3u8_content)
+    playlist.drop_variants(rejected_variant)
+    playlist.drop_media("SUBTITLES")
+    return playlist.dump(lambda uri: uri.replace("https://vixcloud.co/playlist/", f"{instance_url}/clony/"))
+
+#The same playlists with the segment host swapped for an edge, they expire with the upstream body
+edge_playlists = TTLCache(max_entries=2000, max_bytes=int(config.Playlist_Cache_MB) * 1024 * 1024)
+
+def discover_edges(m3u8_content):
+    edges.discover(m3u8_content)
+    return m3u8_content
+
+def edge_playlist(key, m3u8_content, edge):
+    #Media playlists only need their segment hosts swapped: one regex over the body is ~10x faster
+    #than building the model for a long VOD (see the benchmark in hls.py)
+    body = edge_playlists.get((key, edge))
+    if body is None:
+        body = CDN_HOST.sub(f"https://{edge}", m3u8_content)
+        ttl = playlist_cache.ttl_left(key)
+        if ttl:
+            edge_playlists.set((key, edge), body, ttl)
+    return body
  
+#The vixcloud AES key, kept in memory with its validators
+KEY_URL = 'https://vixcloud.co/storage/enc.key'
+Key_Cache_TTL = float(config.Key_Cache_TTL)
+enc_key = {"content": None, "etag": None, "last_modified": None, "fetched": 0}
+key_flight = SingleFlight()
+key_refresh = set()
+
+async def fetch_key():
+    '''Download the key, or just confirm it with a conditional request when we already have it'''
+    client = get_client(proxies=proxies2)
+    headers = {"User-Agent": User_Agent, "user-agent": User_Agent}
+    if enc_key["content"] is not None:
+        if enc_key["etag"]:
+            headers["If-None-Match"] = enc_key["etag"]
+        if enc_key["last_modified"]:
+            headers["If-Modified-Since"] = enc_key["last_modified"]
+    response = await client.get(ForwardProxy + KEY_URL, headers = headers, timeout = 20)
+    if response.status_code == 304 and enc_key["content"] is not None:
+        enc_key["fetched"] = time.time()
+        return
+    response.raise_for_status()
+    enc_key.update(
+        content = response.content,
+        etag = response.headers.get('etag'),
+        last_modified = response.headers.get('last-modified'),
+        fetched = time.time()
+    )
+
+async def revalidate_key():
+    try:
+        await key_flight.do("enc.key", fetch_key)
+    except Exception as e:
+        print(f"MammaMia: enc.key refresh failed, {e}")
+
 @router.api_route('/storage/enc.key')
 async def get_key():
-    async with AsyncSession(timeout = 20) as client:
-        response = await client.get(ForwardProxy + 'https://vixcloud.co/storage/enc.key', headers = {"User-Agent": User_Agent, "user-agent": User_Agent}, proxies = proxies2)
-    
+    if enc_key["content"] is None:
+        try:
+            await key_flight.do("enc.key", fetch_key)
+        except Exception as e:
+            print(f"Failed to fetch enc.key: {e}")
+            raise HTTPException(status_code=404, detail="Key not found")
+    elif time.time() - enc_key["fetched"] > Key_Cache_TTL and not key_refresh:
+        #Serve the key we have, revalidate it in the background
+        task = asyncio.ensure_future(revalidate_key())
+        key_refresh.add(task)
+        task.add_done_callback(key_refresh.discard)
+
     response_headers = {
-        'date': response.headers['date'],
-        'content-length': response.headers['content-length'],
         'content-type': 'application/octet-stream',
         'access-control-allow-origin': '*'
     }
-    
-    return Response(
-        response.content,
-        response.status_code,
-        response_headers
-    )
+    return Response(enc_key["content"], 200, response_headers)
 #r"https://sc-b1-([0-2][0-9]|30).scws-content.net", "https://sc-u9-01.scws-content.net", m3u8_content)
 
 
@@ -0,0 +1,74 @@
+import json
+import sqlite3
+import threading
+import time
+import Src.Utilities.config as config
+from Src.Utilities.cache import TTLCache
+
+Metadata_Cache_TTL = int(config.Metadata_Cache_TTL)
+Cache_DB = config.Cache_DB
+
+
+class MetadataCache:
+    '''
+    Two tier cache for metadata that almost never changes (titles, release dates, ids).
+    An in-process LRU sits in front of a SQLite file, so lookups survive restarts
+    and are shared by every provider. If the file can't be opened (read-only hosts)
+    it silently works in memory only.
+    '''
+    def __init__(self, path, max_entries=20000):
+        self.memory = TTLCache(max_entries=max_entries)
+        self.lock = threading.Lock()
+        self.db = None
+        try:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)")
+            self.db.execute("DELETE FROM metadata WHERE expires < ?", (time.time(),))
+            self.db.commit()
+        except sqlite3.Error as e:
+            print(f"MammaMia: Metadata cache on disk disabled, {e}")
+            self.db = None
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None or self.db is None:
+            return value
+        try:
+            with self.lock:
+                row = self.db.execute("SELECT value, expires FROM metadata WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"MammaMia: Metadata cache read failed, {e}")
+            return None
+        if row is None:
+            return None
+        ttl = row[1] - time.time()
+        if ttl <= 0:
+            return None
+        value = json.loads(row[0])
+        self.memory.set(key, value, ttl)
+        return value
+
+    def set(self, key, value, ttl=Metadata_Cache_TTL):
+        self.memory.set(key, value, ttl)
+        if self.db is None:
+            return
+        try:
+            with self.lock:
+                self.db.execute("INSERT OR REPLACE INTO metadata (key, value, expires) VALUES (?, ?, ?)", (key, json.dumps(value), time.time() + ttl))
+                self.db.commit()
+        except sqlite3.Error as e:
+            print(f"MammaMia: Metadata cache write failed, {e}")
+
+    def delete(self, key):
+        self.memory.pop(key)
+        if self.db is None:
+            return
+        try:
+            with self.lock:
+                self.db.execute("DELETE FROM metadata WHERE key = ?", (key,))
+                self.db.commit()
+        except sqlite3.Error as e:
+            print(f"MammaMia: Metadata cache delete failed, {e}")
+
+
+metadata_cache = MetadataCache(Cache_DB)
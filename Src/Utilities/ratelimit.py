@@ -0,0 +1,66 @@
+import asyncio
+import re
+import time
+import Src.Utilities.config as config
+
+
+class TokenBucket:
+    '''
+    Async token bucket: up to burst requests go out at once, then rate requests per second.
+    Waiters sleep on the event loop, no thread is ever blocked.
+    '''
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        #The lock keeps waiters in FIFO order
+        async with self.lock:
+            self.refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self.refill()
+            self.tokens -= 1
+
+
+def host_key(url):
+    '''
+    Host a request really goes to. With a ForwardProxy prefix (https://proxy/https://site/...)
+    that's the last host in the URL path, query strings are ignored.
+    '''
+    hosts = re.findall(r'https?://([^/?#]+)', url.split('?')[0])
+    if not hosts:
+        return ""
+    host = hosts[-1].lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+buckets = {}
+#Hosts that get a bucket: the site urls of config.json, plus the hosts registered with limit_host
+limited_hosts = dict(config.RATE_LIMITS)
+
+def limit_host(url, site):
+    '''Give the host of url the rate limit of site, for scrapers whose base_url isn't the site url in config.json'''
+    limited_hosts.setdefault(host_key(url), config.SITE_RATE_LIMITS[site])
+
+def bucket_for(url):
+    '''Bucket of the host of url, None for hosts that aren't scraped sites'''
+    host = host_key(url)
+    bucket = buckets.get(host)
+    if bucket is None and host in limited_hosts:
+        bucket = buckets[host] = TokenBucket(*limited_hosts[host])
+    return bucket
+
+async def throttle(url):
+    '''Wait until the upstream host of url allows one more request'''
+    bucket = bucket_for(url)
+    if bucket is not None:
+        await bucket.acquire()
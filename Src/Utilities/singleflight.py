@@ -0,0 +1,26 @@
+import asyncio
+
+
+class SingleFlight:
+    '''
+    Coalesce identical concurrent calls: while a call for a key is running,
+    every other caller for the same key awaits the same future instead of starting its own.
+    The shared call is shielded, so a caller that gets cancelled doesn't cancel it for the others.
+    '''
+    def __init__(self):
+        self.calls = {}
+
+    async def do(self, key, factory):
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self.calls[key] = task
+            task.add_done_callback(lambda done: self.forget(key, done))
+        return await asyncio.shield(task)
+
+    def forget(self, key, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        #Mark the exception as retrieved even if every caller went away
+        if not task.cancelled():
+            task.exception()
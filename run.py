@@ -1,10 +1,10 @@
 from bs4 import BeautifulSoup
 from datetime import datetime
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse, RedirectResponse, HTMLResponse
+from fastapi.responses import JSONResponse, RedirectResponse, HTMLResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from Src.API.filmpertutti import filmpertutti
-from Src.API.streamingcommunity import streaming_community
+from Src.API.streamingcommunity import streaming_community, vixcloud_extract_url
 from Src.API.tantifilm import tantifilm
 from Src.API.lordchannel import lordchannel
 from Src.API.streamingwatch import streamingwatch
@@ -32,16 +32,28 @@ from Src.Utilities.dictionaries import okru, STREAM, extra_sources, webru_vary,
 from Src.API.epg import tivu, tivu_get, epg_guide, convert_bho_1, convert_bho_2, convert_bho_3
 from Src.API.webru import webru, get_skystreaming
 from Src.API.onlineserietv import onlineserietv
-from curl_cffi.requests import AsyncSession
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from slowapi.middleware import SlowAPIMiddleware
 from static.static import HTML
 from urllib.parse import unquote
 from Src.Utilities.m3u8 import router as m3u8_clone
+from Src.Utilities.cache import TTLCache, expiring_ttl, url_expiry
+from Src.Utilities.singleflight import SingleFlight
+from Src.Utilities.clients import get_client, close_clients
+from Src.Utilities.ratelimit import limit_host
+from Src.Utilities.breaker import get_breaker, current_call
+from Src.Utilities import edges
+from contextlib import asynccontextmanager
+from functools import partial
 import urllib.parse
 import re
 import asyncio
+import base64
+import time
+import copy
+import json
+import hashlib
 
 # Configure Env Vars
 Global_Proxy = config.Global_Proxy
@@ -78,6 +90,8 @@ Icon = config.Icon
 Name = config.Name
 SKY_DOMAIN = config.SKY_DOMAIN
 Remote_Instance = config.Remote_Instance
+Stream_First_N = int(config.Stream_First_N)
+Stream_Deadline = float(config.Stream_Deadline)
 
 # CONFIGURAZIONI ANIME
 AS = getattr(config, 'AS', '0')
@@ -105,6 +119,9 @@ if ANIME_SCRAPERS_AVAILABLE:
         if GA == "1":
             anime_scrapers['gogoanime'] = GogoAnimeScraper()
             print("✅ GogoAnime initialized")
+        # I SCRAPER POSSONO USARE UN DOMINIO DIVERSO DA QUELLO IN CONFIG.JSON: IL LIMITE DEL SITO VALE ANCHE LÌ
+        for scraper in anime_scrapers.values():
+            limit_host(scraper.base_url, scraper.name)
         print(f"🎌 Total anime scrapers: {len(anime_scrapers)}")
     except Exception as e:
         print(f"❌ Error initializing anime scrapers: {e}")
@@ -115,8 +132,22 @@ if MYSTERIUS == "1":
 
 DDL_DOMAIN = config.DDL_DOMAIN
 
+# CLIENT HTTP CONDIVISI PER TUTTA LA VITA DELL'APP
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Il client dei provider viene aperto subito, gli altri (m3u8, scrapers, profili diversi) al primo uso
+    get_client(proxies=proxies)
+    # PROBE DEI NODI CDN DI VIXCLOUD IN BACKGROUND
+    edge_probes = asyncio.create_task(edges.probe_loop())
+    # RINNOVO IN BACKGROUND DEI TOKEN DEI TITOLI PIÙ VISTI
+    token_refresh = asyncio.create_task(token_refresh_loop())
+    yield
+    edge_probes.cancel()
+    token_refresh.cancel()
+    await close_clients()
+
 # INIZIALIZZA FASTAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORS MIDDLEWARE OBBLIGATORIO
 app.add_middleware(
@@ -190,31 +221,521 @@ def respond_with(data):
     resp.headers['Access-Control-Allow-Headers'] = '*'
     return resp
 
-async def transform_mfp(mfp_stream_url, client):
+# RISPOSTE PRECALCOLATE (manifest e catalogo TV): JSON già serializzato + ETag
+PRECOMPUTED_MAX_AGE = 3600
+
+def precompute(data):
+    body = json.dumps(data, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+    return body, etag
+
+def respond_precomputed(request, entry, max_age=PRECOMPUTED_MAX_AGE):
+    body, etag = entry
+    headers = {
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Headers': '*',
+        'ETag': etag,
+        'Cache-Control': f'public, max-age={max_age}'
+    }
+    # Il client ha già questa versione: 304 senza body
+    if_none_match = request.headers.get('if-none-match', '')
+    if if_none_match.strip() == '*' or etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def mfp_proxy_url(data):
+    """URL di riproduzione MFP da una risposta dell'extractor (remoto o vixcloud_extract)"""
+    url = data['mediaflow_proxy_url'] + "?api_password=" + data['query_params']['api_password'] + "&d=" + urllib.parse.quote(data['destination_url'])
+    for i in data['request_headers']:
+        url += f"&h_{i}={urllib.parse.quote(data['request_headers'][i])}"
+    return url
+
+# RISULTATI DELL'EXTRACTOR MFP
+# Chiave = URL completo dell'extractor (host MFP, password e destinazione), scadenza presa dall'expires della destinazione
+MFP_Cache_TTL = 600
+MFP_Slow_Seconds = 8
+mfp_cache = TTLCache(max_entries=5000)
+
+async def fetch_mfp(mfp_stream_url, client):
+    mfp_host = urllib.parse.urlparse(mfp_stream_url).netloc
+    breaker = get_breaker(f"MFP {mfp_host}")
+    if not breaker.allow():
+        print(f"⚡ MFP {mfp_host} skipped, circuit open")
+        return None
+    start = time.time()
     try:
-        response = await client.get(mfp_stream_url)
-        data = response.json()
-        url = data['mediaflow_proxy_url'] + "?api_password=" + data['query_params']['api_password'] + "&d=" + urllib.parse.quote(data['destination_url'])
-        for i in data['request_headers']:
-            url += f"&h_{i}={urllib.parse.quote(data['request_headers'][i])}"
-        return url
+        response = await client.get(mfp_stream_url, timeout=20)
+    except Exception as e:
+        breaker.record(False, time.time() - start, str(e))
+        print("Transforming MFP failed", e)
+        return None
+    latency = time.time() - start
+    # Il circuito è per host, condiviso da tutti gli utenti: contano solo errori di rete, 5xx (Space addormentato
+    # o morto) e risposte troppo lente. Un 401/403 per la password sbagliata di un utente non deve chiuderlo agli altri
+    if response.status_code >= 500:
+        breaker.record(False, latency, f"HTTP {response.status_code}")
+        print(f"Transforming MFP failed, HTTP {response.status_code}")
+        return None
+    if latency > MFP_Slow_Seconds:
+        breaker.record(False, latency, f"slow, {latency:.1f}s")
+    else:
+        breaker.record(True, latency)
+    try:
+        if response.status_code >= 400:
+            raise Exception(f"HTTP {response.status_code}")
+        url = mfp_proxy_url(response.json())
     except Exception as e:
         print("Transforming MFP failed", e)
         return None
+    ttl, _ = expiring_ttl([url], MFP_Cache_TTL, 0)
+    mfp_cache.set(mfp_stream_url, url, ttl)
+    return url
+
+async def transform_mfp(mfp_stream_url, client):
+    url = mfp_cache.get(mfp_stream_url)
+    if url is not None:
+        return url
+    return await inflight.do(("mfp", mfp_stream_url), lambda: fetch_mfp(mfp_stream_url, client))
+
+# PROVIDER STREAM
+# Ogni provider restituisce la sua lista di stream, così possono girare tutti in parallelo
+async def mysterius_streams(id, client, provider_maps, MFP, MFP_CREDENTIALS):
+    streams = []
+    results = await cool(id, client)
+    if results:
+        print(f"Mysterius Found Results for {id}")
+        for resolution, link in results.items():
+            streams.append({
+                'title': f'{Icon}Mysterious {resolution}',
+                'url': link,
+                'behaviorHints': {'bingeGroup': f'mysterius{resolution}'}
+            })
+    return streams
+
+async def streamingcommunity_streams(id, client, provider_maps, MFP, MFP_CREDENTIALS):
+    streams = []
+    SC_FAST_SEARCH = provider_maps.get('SC_FAST_SEARCH', '0')
+    url_streaming_community, quality_sc, slug_sc = await streaming_community(id, client, SC_FAST_SEARCH, MFP)
+    if url_streaming_community is not None:
+        print(f"StreamingCommunity Found Results for {id}")
+        if MFP == "1":
+            MFP_url, MFP_password = MFP_CREDENTIALS
+            if config.SC_LOCAL_EXTRACTOR == "1":
+                # PLAYLIST GIÀ ESTRATTA IN LOCALE, A MFP SERVE SOLO IL PROXY
+                url_streaming_community = mfp_proxy_url({
+                    'mediaflow_proxy_url': f'{MFP_url}/proxy/hls/manifest.m3u8',
+                    'query_params': {'api_password': MFP_password},
+                    'destination_url': url_streaming_community,
+                    'request_headers': {'User-Agent': User_Agent}
+                })
+            else:
+                url_streaming_community = f'{MFP_url}/extractor/video?api_password={MFP_password}&d={url_streaming_community}&host=VixCloud&redirect_stream=false'
+                url_streaming_community = await transform_mfp(url_streaming_community, client)
+            if url_streaming_community is None:
+                return streams
+            if "hf.space" in MFP_url:
+                streams.append({
+                    "name": f'{Name}',
+                    'title': f'{Icon}StreamingCommunity\n Sorry StreamingCommunity wont work, most likely, with MFP hosted on HuggingFace',
+                    'url': url_streaming_community
+                })
+            streams.append({
+                "name": f'{Name}\n{quality_sc}p Max' if quality_sc.isdigit() else f'{Name}\n{quality_sc} Max',
+                'title': f'{Icon}StreamingCommunity\n {slug_sc.replace("-"," ").capitalize()}',
+                'url': url_streaming_community,
+                'behaviorHints': {'notWebReady': False, 'bingeGroup': f'streamingcommunity{quality_sc}'}
+            })
+        else:
+            streams.append({
+                "name": f'{Name}\n{quality_sc}p Max',
+                'title': f'{Icon}StreamingCommunity\n {slug_sc.replace("-"," ").capitalize()}\n This will work only on a local instance',
+                'url': url_streaming_community,
+                'behaviorHints': {'proxyHeaders': {"request": {"user-agent": User_Agent}}, 'notWebReady': True, 'bingeGroup': f'streamingcommunity{quality_sc}'}
+            })
+    return streams
+
+async def lordchannel_streams(id, client, provider_maps, MFP, MFP_CREDENTIALS):
+    streams = []
+    url_lordchannel, quality_lordchannel = await lordchannel(id, client)
+    if quality_lordchannel == "FULL HD" and url_lordchannel != None:
+        print(f"LordChannel Found Results for {id}")
+        streams.append({
+            'name': f"{Name}\n1080p",
+            'title': f'{Icon}LordChannel',
+            'url': url_lordchannel,
+            'behaviorHints': {'bingeGroup': 'lordchannel1080'}
+        })
+    elif url_lordchannel != None:
+        print(f"LordChannel Found Results for {id}")
+        streams.append({
+            "name": f"{Name}\n720p",
+            'title': f'{Icon}LordChannel 720p',
+            'url': url_lordchannel,
+            'behaviorHints': {'bingeGroup': 'lordchannel720'}
+        })
+    return streams
+
+async def filmpertutti_streams(id, client, provider_maps, MFP, MFP_CREDENTIALS):
+    streams = []
+    url_filmpertutti, Host = await filmpertutti(id, client, MFP)
+    if url_filmpertutti is not None:
+        print(f"Filmpertutti Found Results for {id}")
+        if MFP == "1" and Host:
+            MFP_url, MFP_password = MFP_CREDENTIALS
+            url_filmpertutti = f'{MFP_url}/extractor/video?api_password={MFP_password}&d={url_filmpertutti}&host={Host}&redirect_stream=false'
+            url_filmpertutti = await transform_mfp(url_filmpertutti, client)
+            if url_filmpertutti is None:
+                return streams
+        streams.append({
+            'name': f'{Name}',
+            'title': f'{Icon}Filmpertutti',
+            'url': url_filmpertutti,
+            'behaviorHints': {'bingeGroup': 'filmpertutti'}
+        })
+    return streams
+
+async def tantifilm_streams(id, client, provider_maps, MFP, MFP_CREDENTIALS):
+    streams = []
+    TF_FAST_SEARCH = provider_maps.get('TF_FAST_SEARCH', '0')
+    url_tantifilm = await tantifilm(id, client, TF_FAST_SEARCH)
+    if url_tantifilm:
+        print(f"Tantifilm Found Results for {id}")
+        if isinstance(url_tantifilm, dict):
+            for title, url in url_tantifilm.items():
+                streams.append({
+                    'name': f'{Name}',
+                    'title': f'{Icon}Tantifilm {title}',
+                    'url': url,
+                    'behaviorHints': {'bingeGroup': 'tantifilm'}
+                })
+        else:
+            streams.append({
+                'name': f'{Name}',
+                'title': f'{Icon}Tantifilm',
+                'url': url_tantifilm,
+                'behaviorHints': {'bingeGroup': 'tantifilm'}
+            })
+    return streams
+
+async def streamingwatch_streams(id, client, provider_maps, MFP, MFP_CREDENTIALS):
+    streams = []
+    url_streamingwatch, Referer = await streamingwatch(id, client)
+    if url_streamingwatch:
+        print(f"StreamingWatch Found Results for {id}")
+        streams.append({
+            'name': f'{Name}',
+            'title': f'{Icon}StreamingWatch',
+            'url': url_streamingwatch,
+            'behaviorHints': {'proxyHeaders': {"request": {"Referer": Referer}}, 'notWebReady': True, 'bingeGroup': 'streamingwatch'}
+        })
+    return streams
+
+async def cb01_streams(id, client, provider_maps, MFP, MFP_CREDENTIALS):
+    streams = []
+    url_cb01 = await cb01(id, client, MFP)
+    if url_cb01:
+        print(f"Cb01 Found Results for {id}")
+        if MFP == "1" and "mixdrop" in url_cb01:
+            MFP_url, MFP_password = MFP_CREDENTIALS
+            url_cb01 = f'{MFP_url}/extractor/video?api_password={MFP_password}&d={url_cb01}&host=Mixdrop&redirect_stream=false'
+            url_cb01 = await transform_mfp(url_cb01, client)
+            if url_cb01 is None:
+                return streams
+        streams.append({
+            'name': f'{Name}',
+            'title': f'{Icon}Cb01',
+            'url': url_cb01,
+            'behaviorHints': {'bingeGroup': 'cb01'}
+        })
+    return streams
+
+async def ddlstream_streams(id, client, provider_maps, MFP, MFP_CREDENTIALS):
+    streams = []
+    url_ddl = await ddlstream(id, client)
+    if url_ddl:
+        print(f"DDLStream Found Results for {id}")
+        streams.append({
+            'name': f'{Name}',
+            'title': f'{Icon}DDLStream',
+            'url': url_ddl,
+            'behaviorHints': {'bingeGroup': 'ddlstream'}
+        })
+    return streams
+
+async def guardaserie_streams(id, client, provider_maps, MFP, MFP_CREDENTIALS):
+    streams = []
+    url_guardaserie = await guardaserie(id, client)
+    if url_guardaserie:
+        print(f"Guardaserie Found Results for {id}")
+        streams.append({
+            'name': f'{Name}',
+            'title': f'{Icon}Guardaserie',
+            'url': url_guardaserie,
+            'behaviorHints': {'bingeGroup': 'guardaserie'}
+        })
+    return streams
+
+async def guardahd_streams(id, client, provider_maps, MFP, MFP_CREDENTIALS):
+    streams = []
+    url_guardahd = await guardahd(id, client)
+    if url_guardahd:
+        print(f"GuardaHD Found Results for {id}")
+        streams.append({
+            'name': f'{Name}',
+            'title': f'{Icon}GuardaHD',
+            'url': url_guardahd,
+            'behaviorHints': {'bingeGroup': 'guardahd'}
+        })
+    return streams
+
+async def onlineserietv_streams(id, client, provider_maps, MFP, MFP_CREDENTIALS):
+    streams = []
+    url_onlineserietv, name_onlineserietv = await onlineserietv(id, client)
+    if url_onlineserietv:
+        print(f"Onlineserietv Found Results for {id}")
+        streams.append({
+            'name': f'{Name}',
+            'title': f'{Icon}Onlineserietv\n{name_onlineserietv}' if name_onlineserietv else f'{Icon}Onlineserietv',
+            'url': url_onlineserietv,
+            'behaviorHints': {'bingeGroup': 'onlineserietv'}
+        })
+    return streams
+
+async def animeworld_streams(id, client, provider_maps, MFP, MFP_CREDENTIALS):
+    streams = []
+    animeworld_urls = await animeworld(id, client)
+    if animeworld_urls:
+        print(f"AnimeWorld Found Results for {id}")
+        i = 0
+        for url in animeworld_urls:
+            if url:
+                title = "Original" if i == 0 else "Italian"
+                streams.append({
+                    'title': f'{Icon}AnimeWorld {title}',
+                    'url': url
+                })
+                i += 1
+    return streams
+
+# ORDINE FISSO DEI PROVIDER: (sito in config.json, flag di istanza, chiave di provider_maps, funzione)
+# L'ordine di questa lista è l'ordine degli stream nella risposta
+STREAM_PROVIDERS = [
+    ("Mysterius", MYSTERIUS, None, mysterius_streams),
+    ("StreamingCommunity", SC, 'STREAMINGCOMMUNITY', streamingcommunity_streams),
+    ("LordChannel", LC, 'LORDCHANNEL', lordchannel_streams),
+    ("Filmpertutti", FT, 'FILMPERTUTTI', filmpertutti_streams),
+    ("Tantifilm", TF, 'TANTIFILM', tantifilm_streams),
+    ("StreamingWatch", SW, 'STREAMINGWATCH', streamingwatch_streams),
+    ("CB01", CB, 'CB01', cb01_streams),
+    ("DDLStream", DDL, 'DDLSTREAM', ddlstream_streams),
+    ("Guardaserie", GS, 'GUARDASERIE', guardaserie_streams),
+    ("GuardaHD", GHD, 'GUARDAHD', guardahd_streams),
+    ("Onlineserietv", OST, 'ONLINESERIETV', onlineserietv_streams),
+]
+KITSU_PROVIDERS = [
+    ("AnimeWorld", AW, 'ANIMEWORLD', animeworld_streams),
+]
+
+def enabled_providers(id, provider_maps):
+    """Provider abilitati sia sull'istanza sia nella config dell'utente, nell'ordine fisso"""
+    providers = KITSU_PROVIDERS if id.startswith('kitsu:') else STREAM_PROVIDERS
+    return [
+        (site, function) for site, enabled, map_key, function in providers
+        if enabled == "1" and (map_key is None or provider_maps.get(map_key) == "1")
+    ]
+
+async def run_provider(site, coro):
+    """
+    Esegue un provider con il suo timeout, restituisce None se va in errore o in timeout.
+    Se il suo circuit breaker è aperto il provider viene saltato subito.
+    """
+    breaker = get_breaker(site)
+    if not breaker.allow():
+        coro.close()
+        print(f"⚡ {site} skipped, circuit open")
+        return None
+    timeout = config.SITE_TIMEOUT.get(site, float(config.Provider_Timeout))
+    call = {"errors": 0}
+    current_call.set(call)
+    start = time.time()
+    try:
+        streams = await asyncio.wait_for(coro, timeout)
+    except asyncio.TimeoutError:
+        print(f"⏱️ {site} timed out after {timeout}s")
+        breaker.record(False, time.time() - start, "timeout")
+        return None
+    except Exception as e:
+        print(f"❌ {site} failed: {e}")
+        breaker.record(False, time.time() - start, str(e))
+        return None
+    # I provider catturano le loro eccezioni: nessun risultato con errori di rete/5xx vale come un guasto
+    if not streams and call["errors"]:
+        breaker.record(False, time.time() - start, f"{call['errors']} upstream errors")
+    else:
+        breaker.record(True, time.time() - start)
+    return streams
+
+# CACHE DEI RISULTATI PER PROVIDER
+# Una voce per (provider, tipo, id, opzioni che cambiano il risultato, credenziali MFP):
+# la risposta per un insieme di provider abilitati è l'unione delle loro voci.
+stream_cache = TTLCache(
+    max_entries=5000,
+    max_bytes=int(config.Stream_Cache_MB) * 1024 * 1024,
+    stale_ttl=int(config.Stream_Cache_Stale)
+)
+EMPTY_RESULT_TTL = 300
+
+# RICHIESTE IDENTICHE CONTEMPORANEE: chi arriva dopo aspetta lo stesso future invece di rifare lo scraping
+inflight = SingleFlight()
+
+def stream_cache_key(site, type, id, provider_maps, MFP, MFP_CREDENTIALS):
+    # Gli URL trasformati da MFP contengono la password dell'utente, quindi la chiave usa le credenziali e non solo il flag
+    mfp_key = tuple(MFP_CREDENTIALS) if MFP == "1" else None
+    options = (provider_maps.get('SC_FAST_SEARCH'), provider_maps.get('TF_FAST_SEARCH'))
+    return (site, type, id, options, mfp_key)
+
+async def fetch_provider(site, function, key, id, client, provider_maps, MFP, MFP_CREDENTIALS):
+    """Esegue il provider e salva il risultato in cache con un TTL che rispetta la scadenza dei token"""
+    streams = await run_provider(site, function(id, client, provider_maps, MFP, MFP_CREDENTIALS))
+    if streams is None:
+        return None
+    ttl = config.SITE_CACHE_TTL.get(site, float(config.Stream_Cache_TTL))
+    if not streams:
+        ttl = min(ttl, EMPTY_RESULT_TTL)
+    ttl, stale_ttl = expiring_ttl([stream.get('url') for stream in streams], ttl, stream_cache.stale_ttl)
+    stream_cache.set(key, streams, ttl, stale_ttl)
+    return streams
+
+async def refresh_provider(site, function, key, id, provider_maps, MFP, MFP_CREDENTIALS):
+    await fetch_provider(site, function, key, id, get_client(proxies=proxies), provider_maps, MFP, MFP_CREDENTIALS)
+
+async def cached_provider(site, function, type, id, client, provider_maps, MFP, MFP_CREDENTIALS):
+    """Risultato dalla cache se c'è, se è scaduto da poco lo si serve e lo si aggiorna in background"""
+    key = stream_cache_key(site, type, id, provider_maps, MFP, MFP_CREDENTIALS)
+    track_popularity(key, (site, function, id, provider_maps, MFP, MFP_CREDENTIALS))
+    streams, fresh = stream_cache.lookup(key)
+    if streams is not None:
+        if not fresh:
+            stream_cache.schedule_refresh(key, lambda: refresh_provider(site, function, key, id, provider_maps, MFP, MFP_CREDENTIALS))
+        return streams
+    return await inflight.do(("provider",) + key, lambda: fetch_provider(site, function, key, id, client, provider_maps, MFP, MFP_CREDENTIALS))
+
+# RINNOVO DEI TOKEN IN SCADENZA PER I TITOLI PIÙ RICHIESTI
+# Ogni voce della cache ha un punteggio di popolarità (richieste che decadono con un'emivita di un'ora).
+# Ogni REFRESH_INTERVAL secondi le voci con token (expires) che stanno per scadere e abbastanza popolari
+# vengono rinnovate in background, le più popolari per prime e al massimo Token_Refresh_Budget al minuto.
+Token_Refresh_Budget = int(config.Token_Refresh_Budget)
+Token_Refresh_Min_Hits = float(config.Token_Refresh_Min_Hits)
+POPULARITY_HALF_LIFE = 3600
+POPULARITY_MAX_ENTRIES = 5000
+REFRESH_INTERVAL = 30
+REFRESH_AHEAD = 180
+popularity = {}
+
+def popularity_score(entry, now):
+    score, updated, args = entry
+    return score * 0.5 ** ((now - updated) / POPULARITY_HALF_LIFE)
+
+def track_popularity(key, args):
+    now = time.time()
+    entry = popularity.get(key)
+    if entry is None and len(popularity) >= POPULARITY_MAX_ENTRIES:
+        del popularity[min(popularity, key=lambda k: popularity_score(popularity[k], now))]
+    score = popularity_score(entry, now) if entry else 0
+    popularity[key] = [score + 1, now, args]
+
+def has_token(streams):
+    return any(url_expiry(stream.get('url')) for stream in streams)
+
+def refresh_expiring_tokens():
+    now = time.time()
+    candidates = []
+    for key, entry in list(popularity.items()):
+        score = popularity_score(entry, now)
+        ttl_left = stream_cache.ttl_left(key)
+        if ttl_left is None:
+            # Non più in cache: se nessuno lo guarda da un po' smettiamo di seguirlo
+            if score < 0.1:
+                del popularity[key]
+            continue
+        if score < Token_Refresh_Min_Hits or ttl_left > REFRESH_AHEAD or key in stream_cache.refreshing:
+            continue
+        if has_token(stream_cache.entries[key][0]):
+            candidates.append((score, key, entry[2]))
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+    budget = max(1, Token_Refresh_Budget * REFRESH_INTERVAL // 60)
+    for score, key, (site, function, id, provider_maps, MFP, MFP_CREDENTIALS) in candidates[:budget]:
+        print(f"🔄 Renewing {site} tokens for {id} (popularity {score:.1f})")
+        stream_cache.schedule_refresh(key, partial(refresh_provider, site, function, key, id, provider_maps, MFP, MFP_CREDENTIALS))
+
+async def token_refresh_loop():
+    while True:
+        await asyncio.sleep(REFRESH_INTERVAL)
+        try:
+            refresh_expiring_tokens()
+        except Exception as e:
+            print(f"Token refresh failed: {e}")
+
+# Task dei provider lasciati finire dopo la risposta, tenuti qui perché non vengano raccolti dal GC
+background_tasks = set()
+
+async def fan_out_providers(type, id, provider_maps, MFP, MFP_CREDENTIALS, first_n=0, deadline=0):
+    """
+    Avvia tutti i provider abilitati insieme e unisce i risultati nell'ordine fisso.
+    Con first_n o deadline si risponde appena ci sono first_n stream o scade la deadline,
+    i provider ancora in corso finiscono in background e riempiono la cache per la prossima richiesta.
+    """
+    providers = enabled_providers(id, provider_maps)
+    client = get_client(proxies=proxies)
+    tasks = [
+        asyncio.ensure_future(cached_provider(site, function, type, id, client, provider_maps, MFP, MFP_CREDENTIALS))
+        for site, function in providers
+    ]
+    pending = set()
+    if tasks and (first_n or deadline):
+        loop = asyncio.get_event_loop()
+        end = loop.time() + deadline if deadline else None
+        pending = set(tasks)
+        collected = 0
+        while pending:
+            timeout = max(0, end - loop.time()) if end is not None else None
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                print(f"⏱️ Stream deadline of {deadline}s reached, {len(pending)} providers still running")
+                break
+            collected += sum(len(task.result() or []) for task in done)
+            if first_n and collected >= first_n:
+                break
+    elif tasks:
+        await asyncio.wait(tasks)
+    for task in pending:
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+    streams = []
+    for task in tasks:
+        if task.done():
+            streams.extend(task.result() or [])
+    return streams
 
 # FUNZIONI ANIME
+async def anime_call(site_name, method, arg):
+    """Chiama un metodo di uno scraper anime, condividendo le chiamate identiche in corso"""
+    scraper = anime_scrapers[site_name]
+    return await inflight.do(("anime", site_name, method, arg), lambda: getattr(scraper, method)(arg))
+
 async def search_anime_multi_source(query: str):
     """Cerca anime su tutti i siti configurati"""
     if not anime_scrapers:
         return []
-        
+    return await inflight.do(("anime_search", query), lambda: search_all_anime_sites(query))
+
+async def search_all_anime_sites(query):
     all_results = []
     
     async def search_site(site_name, scraper):
         try:
             print(f"🔍 Searching {site_name} for: {query}")
-            loop = asyncio.get_event_loop()
-            results = await loop.run_in_executor(None, scraper.search, query)
+            results = await anime_call(site_name, 'search', query)
             for result in results:
                 result['source_site'] = site_name
             return results
@@ -246,32 +767,114 @@ def deduplicate_anime_results(results):
     
     return unique_results
 
+# ID STREMIO ANIME: anime_{sito}~{chiave in base64url}[:stagione:episodio]
+# LA CHIAVE È QUELLA DEL SITO (ID ANIMEUNITY, SLUG ANIMESATURN/GOGOANIME), COSÌ META E STREAM NON RIFANNO LA RICERCA.
+# GLI ID VECCHI anime_{sito}_{titolo} DELLE LIBRERIE ESISTENTI RESTANO VALIDI E PASSANO DALLA RICERCA
+def encode_anime_id(site_name, key):
+    token = base64.urlsafe_b64encode(key.encode()).decode().rstrip('=')
+    return f"anime_{site_name}~{token}"
+
+def parse_anime_id(id):
+    """(sito, chiave, titolo, episodio): chiave None per gli id vecchi, episodio None senza :stagione:episodio"""
+    base, *suffix = id.split(':')
+    episode = suffix[1] if len(suffix) >= 2 else None
+    if '~' in base:
+        site_name, token = base[len('anime_'):].split('~', 1)
+        # LA CHIAVE VIENE DALL'UTENTE: SE LO SCRAPER NON CI RICOSTRUISCE UNA SUA PAGINA L'ID NON È VALIDO
+        try:
+            key = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+            anime_scrapers[site_name].source_url(key)
+        except (ValueError, KeyError):
+            return None
+        return site_name, key, None, episode
+    parts = base.split('_')
+    if len(parts) < 3:
+        return None
+    return parts[1], None, ' '.join(parts[2:]), episode
+
+async def resolve_anime_url(site_name, key, title):
+    """URL della pagina dell'anime: ricostruito dalla chiave, o cercato per titolo con gli id vecchi"""
+    if key is not None:
+        return anime_scrapers[site_name].source_url(key)
+    search_results = await anime_call(site_name, 'search', title)
+    return search_results[0]['url'] if search_results else None
+
+# NOME E POSTER DEI RISULTATI DEL CATALOGO PER LA PAGINA META, SOLO IN MEMORIA: SE MANCANO IL NOME VIENE DALLA CHIAVE
+ANIME_META_TTL = 24 * 3600
+anime_meta_cache = TTLCache(max_entries=5000)
+
+# LISTA EPISODI PER SERIE: META E STREAM LA CONDIVIDONO, UNA SESSIONE DI BINGE LA SCARICA UNA VOLTA SOLA
+ANIME_EPISODES_TTL = 3600
+anime_episodes_cache = TTLCache(max_entries=2000)
+
+async def get_anime_episodes(site_name, anime_url, refresh=False):
+    episodes = None if refresh else anime_episodes_cache.get((site_name, anime_url))
+    if episodes is None:
+        episodes = await anime_call(site_name, 'get_episodes', anime_url)
+        if episodes:
+            anime_episodes_cache.set((site_name, anime_url), episodes, ANIME_EPISODES_TTL)
+    return episodes
+
+async def find_anime_episode(site_name, anime_url, episode):
+    """L'episodio chiesto dalla lista in cache, il primo se l'id non ne indica uno"""
+    cached = anime_episodes_cache.get((site_name, anime_url))
+    episodes = cached if cached is not None else await get_anime_episodes(site_name, anime_url)
+    if not episodes:
+        return None
+    if episode is None:
+        return episodes[0]
+    found = next((ep for ep in episodes if str(ep['number']) == episode), None)
+    if found is None and cached is not None:
+        # Forse è uscito dopo che la lista è stata messa in cache, appena scaricata invece è già aggiornata
+        episodes = await get_anime_episodes(site_name, anime_url, refresh=True)
+        found = next((ep for ep in episodes or [] if str(ep['number']) == episode), None)
+    return found
+
 # ENDPOINT MANIFEST BASE
+def build_manifest(livetv):
+    manifest = copy.deepcopy(MANIFEST)
+    if not livetv:
+        # Mantieni anime se disponibili, rimuovi solo TV
+        if not anime_scrapers:
+            manifest["catalogs"] = []
+            manifest["resources"].remove("catalog")
+        else:
+            manifest["catalogs"] = [cat for cat in manifest["catalogs"] if cat["type"] != "tv"]
+    return manifest
+
+# UNA VARIANTE PER CONFIG CON/SENZA LIVETV
+MANIFEST_RESPONSES = {livetv: precompute(build_manifest(livetv)) for livetv in (True, False)}
+
 @app.get('/manifest.json')
-def base_manifest():
+def base_manifest(request: Request):
     print("📋 Base manifest request")
-    return respond_with(MANIFEST)
+    return respond_precomputed(request, MANIFEST_RESPONSES[True])
+
+@app.get('/health/providers')
+def health_providers():
+    """Stato dei circuit breaker dei provider"""
+    sites = [site for site, enabled, map_key, function in STREAM_PROVIDERS + KITSU_PROVIDERS if enabled == "1"]
+    return respond_with({site: get_breaker(site).snapshot() for site in sites})
+
+@app.get('/extractor/vixcloud')
+@limiter.limit("5/second")
+async def extractor_vixcloud(request: Request, d: str):
+    """Extractor VixCloud integrato, stessa risposta dell'extractor MFP (senza i campi del proxy)"""
+    try:
+        data = await vixcloud_extract_url(unquote(d), get_client(proxies=proxies))
+    except Exception as e:
+        print(f"VixCloud extraction failed: {e}")
+        raise HTTPException(status_code=404, detail="VixCloud extraction failed")
+    return respond_with(data)
 
 @app.get('/config')
 def config_redirect():
     return RedirectResponse(url="/")
 
 @app.get('/{config:path}/manifest.json')
-def addon_manifest(config: str):
+def addon_manifest(request: Request, config: str):
     print(f"📋 Manifest with config: {config}")
-    manifest_copy = MANIFEST.copy()
-    
-    if "LIVETV" in config:
-        return respond_with(manifest_copy)
-    elif "LIVETV" not in config:
-        # Mantieni anime se disponibili, rimuovi solo TV
-        if not anime_scrapers:
-            manifest_copy["catalogs"] = []
-            if "catalog" in manifest_copy["resources"]:
-                manifest_copy["resources"].remove("catalog")
-        else:
-            manifest_copy["catalogs"] = [cat for cat in manifest_copy["catalogs"] if cat["type"] != "tv"]
-        return respond_with(manifest_copy)
+    return respond_precomputed(request, MANIFEST_RESPONSES["LIVETV" in config])
 
 @app.get('/', response_class=HTMLResponse)
 def root(request: Request):
@@ -301,7 +904,7 @@ async def test_scrapers():
         
         try:
             # Test ricerca base
-            search_results = scraper.search("naruto")
+            search_results = await scraper.search("naruto")
             
             site_results = {
                 "status": "working",
@@ -320,7 +923,7 @@ async def test_scrapers():
                 
                 # Test episodi (solo per il primo risultato)
                 try:
-                    episodes = scraper.get_episodes(first_anime['url'])
+                    episodes = await scraper.get_episodes(first_anime['url'])
                     site_results["episodes_count"] = len(episodes)
                     
                     if episodes:
@@ -332,7 +935,7 @@ async def test_scrapers():
                         
                         # Test stream (solo per primo episodio)
                         try:
-                            streams = scraper.get_stream_links(episodes[0]['url'])
+                            streams = await scraper.get_stream_links(episodes[0]['url'])
                             site_results["streams_count"] = len(streams)
                             
                             if streams:
@@ -371,11 +974,11 @@ async def debug_animesaturn():
     
     try:
         # Test connessione base
-        response = scraper.make_request(scraper.base_url)
+        response = await scraper.make_request(scraper.base_url)
         
         # Test ricerca
         search_url = f"{scraper.base_url}/animelist"
-        search_response = scraper.make_request(search_url, params={'search': 'naruto'})
+        search_response = await scraper.make_request(search_url, params={'search': 'naruto'})
         
         soup = BeautifulSoup(search_response.text, 'html.parser')
         
@@ -403,7 +1006,7 @@ async def debug_episode(episode_id: str):
     episode_url = f"https://www.animesaturn.cx/ep/{episode_id}"
     
     try:
-        response = scraper.make_request(episode_url)
+        response = await scraper.make_request(episode_url)
         soup = BeautifulSoup(response.text, 'html.parser')
         
         return {
@@ -437,25 +1040,39 @@ def test_method():
 
 
 # CATALOGHI
-async def addon_catalog(type: str, id: str, genre: str = None, search: str = None):
-    if type == "tv":
-        catalogs = {"metas": []}
+def tv_catalog(genre=None):
+    catalogs = {"metas": []}
+    
+    for channel in STREAM["channels"]:
+        if genre and genre not in channel.get("genres", []):
+            continue
         
-        for channel in STREAM["channels"]:
-            if genre and genre not in channel.get("genres", []):
-                continue
-            
-            description = f'Watch {channel["title"]}'
-            catalogs["metas"].append({
-                "id": channel["id"],
-                "type": "tv",
-                "name": channel["title"],
-                "poster": channel["poster"],
-                "description": description,
-                "genres": channel.get("genres", [])
-            })
+        description = f'Watch {channel["title"]}'
+        catalogs["metas"].append({
+            "id": channel["id"],
+            "type": "tv",
+            "name": channel["title"],
+            "poster": channel["poster"],
+            "description": description,
+            "genres": channel.get("genres", [])
+        })
 
-        return catalogs
+    return catalogs
+
+# CATALOGO TV PRECALCOLATO PER OGNI GENERE (None = tutti i canali)
+TV_GENRES = {genre for channel in STREAM["channels"] for genre in channel.get("genres", [])}
+TV_CATALOG_RESPONSES = {genre: precompute(tv_catalog(genre)) for genre in [None, *TV_GENRES]}
+
+def tv_catalog_response(genre=None):
+    entry = TV_CATALOG_RESPONSES.get(genre or None)
+    if entry is None:
+        # Genere sconosciuto, nessun canale: non lo salviamo per non far crescere la tabella
+        entry = precompute(tv_catalog(genre))
+    return entry
+
+async def addon_catalog(type: str, id: str, genre: str = None, search: str = None):
+    if type == "tv":
+        return tv_catalog(genre)
     
     # CATALOGHI ANIME
     elif type == "series" and id.startswith("anime_") and anime_scrapers:
@@ -467,8 +1084,15 @@ async def addon_catalog(type: str, id: str, genre: str = None, search: str = Non
             anime_results = deduplicate_anime_results(anime_results)
             
             for anime in anime_results[:20]:
-                anime_id = f"anime_{anime['source_site']}_{anime['title'].replace(' ', '_').lower()}"
-                anime_id = re.sub(r'[^\w_]', '', anime_id)
+                site_name = anime['source_site']
+                try:
+                    key = anime_scrapers[site_name].source_key(anime['url'])
+                    anime_scrapers[site_name].source_url(key)
+                    anime_id = encode_anime_id(site_name, key)
+                except Exception:
+                    continue
+                # NOME E POSTER PER LA PAGINA META, CHE DALL'ID HA SOLO LA CHIAVE
+                anime_meta_cache.set(anime_id, {'name': anime['title'], 'poster': anime.get('image')}, ANIME_META_TTL)
                 
                 catalogs["metas"].append({
                     "id": anime_id,
@@ -491,11 +1115,15 @@ async def addon_catalog(type: str, id: str, genre: str = None, search: str = Non
 @limiter.limit("5/second")
 async def first_catalog(request: Request, type: str, id: str, genre: str = None):
     search = request.query_params.get('search')
+    if type == "tv":
+        return respond_precomputed(request, tv_catalog_response(genre))
     catalogs = await addon_catalog(type, id, genre, search)
     return respond_with(catalogs)
 
 @app.get('/{config:path}/catalog/{type}/{id}/genre={genre}.json')
-async def catalog_with_genre(type: str, id: str, genre: str = None):
+async def catalog_with_genre(request: Request, type: str, id: str, genre: str = None):
+    if type == "tv":
+        return respond_precomputed(request, tv_catalog_response(genre))
     catalogs = await addon_catalog(type, id, genre)
     return respond_with(catalogs)
 
@@ -513,15 +1141,15 @@ async def addon_meta(request: Request, id: str):
     if not channel:
         raise HTTPException(status_code=404, detail="Channel not found")
     
-    async with AsyncSession(proxies=proxies) as client:
-        if channel["id"] in convert_bho_1 or channel["id"] in convert_bho_2 or channel["id"] in convert_bho_3:
-            description, title = await epg_guide(channel["id"], client)
-        elif channel["id"] in tivu:
-            description = await tivu_get(channel["id"], client)
-            title = ""
-        else:
-            description = f'Watch {channel["title"]}'
-            title = ""
+    client = get_client(proxies=proxies)
+    if channel["id"] in convert_bho_1 or channel["id"] in convert_bho_2 or channel["id"] in convert_bho_3:
+        description, title = await epg_guide(channel["id"], client)
+    elif channel["id"] in tivu:
+        description = await tivu_get(channel["id"], client)
+        title = ""
+    else:
+        description = f'Watch {channel["title"]}'
+        title = ""
     
     meta = {
         'meta': {
@@ -563,19 +1191,40 @@ async def series_meta(request: Request, id: str):
     print(f"📺 Series meta request: {id}")
     
     if id.startswith('anime_') and anime_scrapers:
-        parts = id.split('_')
-        if len(parts) >= 3:
-            source_site = parts[1]
-            anime_title = ' '.join(parts[2:]).replace('_', ' ').title()
+        parsed = parse_anime_id(id)
+        if parsed:
+            source_site, key, anime_title, episode = parsed
+            cached = anime_meta_cache.get(id.split(':')[0]) or {}
+            if anime_title is None:
+                # SENZA CACHE IL NOME VIENE DALLO SLUG, SENZA L'ID NUMERICO DAVANTI (ANIMEUNITY)
+                anime_title = cached.get('name') or re.sub(r'^\d+-', '', key.rsplit('/', 1)[-1]).replace('-', ' ').title()
+            else:
+                anime_title = anime_title.title()
+            
+            videos = []
+            if source_site in anime_scrapers:
+                try:
+                    anime_url = await resolve_anime_url(source_site, key, parsed[2])
+                    episodes = await get_anime_episodes(source_site, anime_url) if anime_url else []
+                    base_id = id.split(':')[0]
+                    videos = [{
+                        'id': f"{base_id}:1:{ep['number']}",
+                        'title': ep.get('title') or f"Episodio {ep['number']}",
+                        'season': 1,
+                        'episode': ep['number']
+                    } for ep in episodes or []]
+                except Exception as e:
+                    print(f"❌ Error getting anime episodes: {e}")
             
             meta = {
                 'meta': {
                     'id': id,
                     'type': 'series',
                     'name': anime_title,
-                    'poster': None,
+                    'poster': cached.get('poster'),
                     'description': f"Anime disponibile su {source_site.upper()}",
-                    'genres': ['Anime']
+                    'genres': ['Anime'],
+                    'videos': videos
                 }
             }
             return respond_with(meta)
@@ -608,25 +1257,19 @@ async def addon_stream(request: Request, config, type, id):
         print(f"🎌 Custom anime stream request: {id}")
         
         try:
-            parts = id.split('_')
-            if len(parts) >= 3:
-                source_site = parts[1]
-                anime_title = ' '.join(parts[2:]).replace('_', ' ')
+            parsed = parse_anime_id(id)
+            if parsed:
+                source_site, key, anime_title, episode = parsed
                 
                 if source_site in anime_scrapers:
-                    scraper = anime_scrapers[source_site]
-                    loop = asyncio.get_event_loop()
-                    
-                    # Cerca anime
-                    search_results = await loop.run_in_executor(None, scraper.search, anime_title)
-                    if search_results:
-                        anime_url = search_results[0]['url']
+                    # Pagina dell'anime dalla chiave nell'id, la ricerca serve solo per gli id vecchi
+                    anime_url = await resolve_anime_url(source_site, key, anime_title)
+                    if anime_url:
                         
-                        # Ottieni episodi
-                        episodes = await loop.run_in_executor(None, scraper.get_episodes, anime_url)
-                        if episodes:
-                            first_episode = episodes[0]
-                            stream_links = await loop.run_in_executor(None, scraper.get_stream_links, first_episode['url'])
+                        # Episodio dalla lista in cache della serie
+                        anime_episode = await find_anime_episode(source_site, anime_url, episode)
+                        if anime_episode:
+                            stream_links = await anime_call(source_site, 'get_stream_links', anime_episode['url'])
                             
                             for stream in stream_links:
                                 streams['streams'].append({
@@ -675,95 +1318,28 @@ async def addon_stream(request: Request, config, type, id):
             MFP_CREDENTIALS = [MFP_url, MFP_password]
             if MFP_url and MFP_password:
                 MFP = "1"
+
+        # MODALITÀ PROGRESSIVA: FIRST[N,secondi] nella config, altrimenti i valori dell'istanza
+        first_n, deadline = Stream_First_N, Stream_Deadline
+        first_match = re.search(r"FIRST\[(\d+),(\d+(?:\.\d+)?)\]", unquote(config))
+        if first_match:
+            first_n, deadline = int(first_match.group(1)), float(first_match.group(2))
         
-        async with AsyncSession(proxies=proxies) as client:
-            # GESTIONE ANIME KITSU
-            if id.startswith('kitsu:'):
-                if provider_maps['ANIMEWORLD'] == "1" and AW == "1":
-                    animeworld_urls = await animeworld(id, client)
-                    if animeworld_urls:
-                        print(f"AnimeWorld Found Results for {id}")
-                        i = 0
-                        for url in animeworld_urls:
-                            if url:
-                                title = "Original" if i == 0 else "Italian"
-                                streams['streams'].append({
-                                    'title': f'{Icon}AnimeWorld {title}', 
-                                    'url': url
-                                })
-                                i += 1
-            
-            # GESTIONE FILM E SERIE NORMALI
-            else:
-                import time
-                current_time = int(time.time())
-                if 1743487223 <= current_time <= 1743544823:
-                    streams['streams'].append({
-                        'name': f"{Name} 4K",
-                        'title': f'{Icon}Netflix/Prime Extractor 4K', 
-                        'url': "https://cdn-cf-east.streamable.com/video/mp4/jkx9gr.mp4?Expires=1743457311748&Key-Pair-Id=APKAIEYUVEN4EVB2OKEQ&Signature=gpixXPFJb5huM8D6AMkbzNqmAON-9zBUVIN5AeWcHiXBVROSz6BlmctAVx0qpe-hM1DN3OO7YtIdBKKOk3IthF33agmVmVjSyNI-emjf~iuqxclbaousBJTPXMIjDQTxBxINr0SUbyS4MiIwhar~luiqqvbPHN9jS-AXT2r1chhZylE4Zol~bKSCCT10TzN3En630XMk0UiTFCgwoAxfitI4mnuCXu4M3-mcnN~kpxx9j6VgE0jVzBKFq9qYbi-CtWOCL7mVaVaCwrTPPe9syZVQgIlgQJt175raLM2G2~faR~wuDOda7KmGNJJH2hDfdd~-sPsr6SSNV0B9ZZ3eaw__"
-                    })
-                
-                if MYSTERIUS == "1":
-                    results = await cool(id, client)
-                    if results:
-                        print(f"Mysterius Found Results for {id}")
-                        for resolution, link in results.items():
-                            streams['streams'].append({
-                                'title': f'{Icon}Mysterious {resolution}', 
-                                'url': link, 
-                                'behaviorHints': {'bingeGroup': f'mysterius{resolution}'}
-                            })
-                
-                if provider_maps['STREAMINGCOMMUNITY'] == "1" and SC == "1":
-                    SC_FAST_SEARCH = provider_maps.get('SC_FAST_SEARCH', '0')
-                    url_streaming_community, quality_sc, slug_sc = await streaming_community(id, client, SC_FAST_SEARCH, MFP)
-                    if url_streaming_community is not None:
-                        print(f"StreamingCommunity Found Results for {id}")
-                        if MFP == "1":
-                            url_streaming_community = f'{MFP_url}/extractor/video?api_password={MFP_password}&d={url_streaming_community}&host=VixCloud&redirect_stream=false'
-                            url_streaming_community = await transform_mfp(url_streaming_community, client)
-                            if "hf.space" in MFP_url:
-                                streams['streams'].append({
-                                    "name": f'{Name}', 
-                                    'title': f'{Icon}StreamingCommunity\n Sorry StreamingCommunity wont work, most likely, with MFP hosted on HuggingFace',
-                                    'url': url_streaming_community
-                                })
-                            streams['streams'].append({
-                                "name": f'{Name}\n{quality_sc} Max', 
-                                'title': f'{Icon}StreamingCommunity\n {slug_sc.replace("-"," ").capitalize()}',
-                                'url': url_streaming_community,
-                                'behaviorHints': {'notWebReady': False, 'bingeGroup': f'streamingcommunity{quality_sc}'}
-                            })
-                        else:
-                            streams['streams'].append({
-                                "name": f'{Name}\n{quality_sc}p Max', 
-                                'title': f'{Icon}StreamingCommunity\n {slug_sc.replace("-"," ").capitalize()}\n This will work only on a local instance',
-                                'url': url_streaming_community,
-                                'behaviorHints': {'proxyHeaders': {"request": {"user-agent": User_Agent}}, 'notWebReady': True, 'bingeGroup': f'streamingcommunity{quality_sc}'}
-                            })
-                
-                # TUTTI GLI ALTRI PROVIDER ORIGINALI
-                if provider_maps['LORDCHANNEL'] == "1" and LC == "1":
-                    url_lordchannel, quality_lordchannel = await lordchannel(id, client)
-                    if quality_lordchannel == "FULL HD" and url_lordchannel != None:
-                        print(f"LordChannel Found Results for {id}")
-                        streams['streams'].append({
-                            'name': f"{Name}\n1080p",
-                            'title': f'{Icon}LordChannel', 
-                            'url': url_lordchannel,
-                            'behaviorHints': {'bingeGroup': 'lordchannel1080'}
-                        })
-                    elif url_lordchannel != None:
-                        print(f"LordChannel Found Results for {id}")
-                        streams['streams'].append({
-                            "name": f"{Name}\n720p",
-                            'title': f'{Icon}LordChannel 720p', 
-                            'url': url_lordchannel, 
-                            'behaviorHints': {'bingeGroup': 'lordchannel720'}
-                        })
-                
-                # ... AGGIUNGI TUTTI GLI ALTRI PROVIDER ORIGINALI QUI ...
+        import time
+        current_time = int(time.time())
+        if 1743487223 <= current_time <= 1743544823 and not id.startswith('kitsu:'):
+            streams['streams'].append({
+                'name': f"{Name} 4K",
+                'title': f'{Icon}Netflix/Prime Extractor 4K', 
+                'url': "https://cdn-cf-east.streamable.com/video/mp4/jkx9gr.mp4?Expires=1743457311748&Key-Pair-Id=APKAIEYUVEN4EVB2OKEQ&Signature=gpixXPFJb5huM8D6AMkbzNqmAON-9zBUVIN5AeWcHiXBVROSz6BlmctAVx0qpe-hM1DN3OO7YtIdBKKOk3IthF33agmVmVjSyNI-emjf~iuqxclbaousBJTPXMIjDQTxBxINr0SUbyS4MiIwhar~luiqqvbPHN9jS-AXT2r1chhZylE4Zol~bKSCCT10TzN3En630XMk0UiTFCgwoAxfitI4mnuCXu4M3-mcnN~kpxx9j6VgE0jVzBKFq9qYbi-CtWOCL7mVaVaCwrTPPe9syZVQgIlgQJt175raLM2G2~faR~wuDOda7KmGNJJH2hDfdd~-sPsr6SSNV0B9ZZ3eaw__"
+            })
+
+        # TUTTI I PROVIDER PARTONO INSIEME, LA RISPOSTA ASPETTA SOLO IL PIÙ LENTO
+        # Stessa richiesta (tipo, id, config) già in corso: si aspetta quella
+        streams['streams'].extend(await inflight.do(
+            ("stream", type, id, config),
+            lambda: fan_out_providers(type, id, provider_maps, MFP, MFP_CREDENTIALS, first_n, deadline)
+        ))
         
         return respond_with(streams)
     
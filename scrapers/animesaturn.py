@@ -1,4 +1,3 @@
-import requests
 from bs4 import BeautifulSoup
 import re
 import base64
@@ -14,7 +13,7 @@ class AnimeSaturnScraper(BaseScraper):
         self.enabled = getattr(config, 'AS', '0') == "1"
         print(f"AnimeSaturn initialized: enabled={self.enabled}, base_url={self.base_url}")
         
-    def search(self, query):
+    async def search(self, query):
         if not self.enabled:
             return []
             
@@ -22,7 +21,7 @@ class AnimeSaturnScraper(BaseScraper):
             search_url = f"{self.base_url}/animelist"
             params = {'search': query}
             
-            response = self.make_request(search_url, params=params)
+            response = await self.make_request(search_url, params=params)
             soup = BeautifulSoup(response.text, 'html.parser')
             
             results = []
@@ -103,12 +102,12 @@ class AnimeSaturnScraper(BaseScraper):
             print(f"AnimeSaturn search error: {e}")
             return []
     
-    def get_episodes(self, anime_url):
+    async def get_episodes(self, anime_url):
         if not self.enabled:
             return []
             
         try:
-            response = self.make_request(anime_url)
+            response = await self.make_request(anime_url)
             soup = BeautifulSoup(response.text, 'html.parser')
             
             episodes = []
@@ -140,14 +139,14 @@ class AnimeSaturnScraper(BaseScraper):
             print(f"AnimeSaturn episodes error: {e}")
             return []
     
-    def get_stream_links(self, episode_url):
+    async def get_stream_links(self, episode_url):
         """Metodo per ottenere link stream da AnimeSaturn"""
         if not self.enabled:
             return []
             
         try:
             print(f"🔗 AnimeSaturn getting streams from: {episode_url}")
-            response = self.make_request(episode_url)
+            response = await self.make_request(episode_url)
             soup = BeautifulSoup(response.text, 'html.parser')
             
             streams = []
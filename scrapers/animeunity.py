@@ -1,7 +1,10 @@
 # File: scrapers/animeunity.py
-import requests
+import asyncio
+import base64
 import re
 import json
+import time
+from curl_cffi.requests import RequestsError
 from urllib.parse import urljoin
 from bs4 import BeautifulSoup
 import Src.Utilities.config as config
@@ -14,25 +17,80 @@ class AnimeUnityScraper(BaseScraper):
         self.base_url = "https://www.animeunity.so"
         self.api_url = f"{self.base_url}/api"
         self.enabled = getattr(config, 'AU', '0') == "1"
-        self.access_token = self._get_access_token()
-        self.headers = {
-            'Authorization': f'Bearer {self.access_token}',
+        # Token JWT preso al primo uso e tenuto fino alla sua scadenza
+        self.access_token = None
+        self.token_expires = 0
+        self.token_failed_at = 0
+        self.token_lock = asyncio.Lock()
+        self.user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36'
+
+    def source_url(self, key):
+        """La chiave è {anime_id}-{slug}: get_episodes legge solo l'id, lo slug dà un nome leggibile senza cache"""
+        if not re.match(r'^\d+', key):
+            raise ValueError(f"Chiave anime non valida: {key}")
+        return super().source_url(key)
+
+    def _token_expiry(self, token):
+        """Scadenza (exp) del JWT meno un minuto di margine, un'ora se non si riesce a leggerla"""
+        try:
+            payload = token.split('.')[1]
+            payload += '=' * (-len(payload) % 4)
+            return json.loads(base64.urlsafe_b64decode(payload))['exp'] - 60
+        except Exception:
+            return time.time() + 3600
+
+    def _token_valid(self, stale):
+        return self.access_token and self.access_token != stale and time.time() < self.token_expires
+
+    async def get_access_token(self, stale=None):
+        """Ottieni token JWT dalla pagina principale, stale è un token appena rifiutato con 401"""
+        if self._token_valid(stale):
+            return self.access_token
+        async with self.token_lock:
+            # Un'altra richiesta potrebbe averlo appena rinnovato
+            if self._token_valid(stale):
+                return self.access_token
+            # Dopo un errore non riproviamo per 30 secondi
+            if time.time() - self.token_failed_at < 30:
+                return None
+            try:
+                response = await self.make_request(self.base_url, timeout=10)
+                match = re.search(r'window\.accessToken\s*=\s*"([^"]+)"', response.text)
+                if not match:
+                    raise ValueError("token non trovato")
+                self.access_token = match.group(1)
+                self.token_expires = self._token_expiry(self.access_token)
+                return self.access_token
+            except Exception as e:
+                print(f"Errore ottenimento token: {e}")
+                self.access_token = None
+                self.token_failed_at = time.time()
+                return None
+
+    def _auth_headers(self, token):
+        return {
+            'Authorization': f'Bearer {token}',
             'X-Requested-With': 'XMLHttpRequest',
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36'
+            'User-Agent': self.user_agent
         }
 
-    def _get_access_token(self):
-        """Ottieni token JWT dalla pagina principale"""
+    async def api_request(self, url, **kwargs):
+        """Richiesta alle API con il token, se viene rifiutato (401) lo rinnova una volta e riprova"""
+        token = await self.get_access_token()
+        if not token:
+            return None
         try:
-            response = requests.get(self.base_url, timeout=10)
-            match = re.search(r'window\.accessToken\s*=\s*"([^"]+)"', response.text)
-            return match.group(1) if match else None
-        except Exception as e:
-            print(f"Errore ottenimento token: {e}")
+            return await self.make_request(url, headers=self._auth_headers(token), **kwargs)
+        except RequestsError as e:
+            if getattr(getattr(e, 'response', None), 'status_code', None) != 401:
+                raise
+        token = await self.get_access_token(stale=token)
+        if not token:
             return None
+        return await self.make_request(url, headers=self._auth_headers(token), **kwargs)
 
-    def search(self, query):
-        if not self.enabled or not self.access_token:
+    async def search(self, query):
+        if not self.enabled:
             return []
             
         try:
@@ -42,13 +100,12 @@ class AnimeUnityScraper(BaseScraper):
                 'fields': 'id,title,slug,imageurl,type'
             }
             
-            response = requests.get(
+            response = await self.api_request(
                 f"{self.api_url}/search",
-                params=params,
-                headers=self.headers
+                params=params
             )
             
-            if response.status_code == 200:
+            if response is not None and response.status_code == 200:
                 return [{
                     'title': item['title'],
                     'url': f"{self.base_url}/anime/{item['id']}-{item['slug']}",
@@ -64,19 +121,18 @@ class AnimeUnityScraper(BaseScraper):
             print(f"Errore ricerca AnimeUnity: {e}")
             return []
 
-    def get_episodes(self, anime_url):
-        if not self.enabled or not self.access_token:
+    async def get_episodes(self, anime_url):
+        if not self.enabled:
             return []
             
         try:
             anime_id = re.search(r'/anime/(\d+)', anime_url).group(1)
             
-            response = requests.get(
-                f"{self.api_url}/anime/{anime_id}/episodes",
-                headers=self.headers
+            response = await self.api_request(
+                f"{self.api_url}/anime/{anime_id}/episodes"
             )
             
-            if response.status_code == 200:
+            if response is not None and response.status_code == 200:
                 return [{
                     'number': ep['number'],
                     'title': f"Episodio {ep['number']}",
@@ -90,19 +146,18 @@ class AnimeUnityScraper(BaseScraper):
             print(f"Errore episodi AnimeUnity: {e}")
             return []
 
-    def get_stream_links(self, episode_url):
-        if not self.enabled or not self.access_token:
+    async def get_stream_links(self, episode_url):
+        if not self.enabled:
             return []
             
         try:
             episode_id = re.search(r'/episodio-(\d+)', episode_url).group(1)
             
-            response = requests.get(
-                f"{self.api_url}/episode/{episode_id}/sources",
-                headers=self.headers
+            response = await self.api_request(
+                f"{self.api_url}/episode/{episode_id}/sources"
             )
             
-            if response.status_code == 200:
+            if response is not None and response.status_code == 200:
                 return [{
                     'url': src['url'],
                     'quality': src.get('quality', 'HD'),
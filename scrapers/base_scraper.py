@@ -1,27 +1,22 @@
-import requests
-import time
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+import asyncio
 import random
+import re
+from urllib.parse import urlparse
+from curl_cffi.requests import RequestsError
+from Src.Utilities.clients import get_client
 
 class BaseScraper:
+    # Path delle pagine anime del sito: quello che lo segue è la chiave stabile messa negli id Stremio
+    anime_path = '/anime/'
+
     def __init__(self):
-        self.session = requests.Session()
         self.setup_session()
-        self.last_request_time = 0
-        self.min_delay = 1  # Minimo 1 secondo tra richieste
-        
-    def setup_session(self):
         # Configurazione retry
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        self.session.mount("http://", adapter)
-        self.session.mount("https://", adapter)
-        
+        self.retry_total = 3
+        self.retry_backoff = 1
+        self.retry_status = [429, 500, 502, 503, 504]
+
+    def setup_session(self):
         # Headers comuni realistici
         user_agents = [
             'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -29,32 +24,50 @@ class BaseScraper:
             'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         ]
-        
-        self.session.headers.update({
+
+        self.default_headers = {
             'User-Agent': random.choice(user_agents),
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
             'Accept-Language': 'it-IT,it;q=0.8,en-US;q=0.5,en;q=0.3',
-            'Accept-Encoding': 'gzip, deflate',
-            'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
             'Sec-Fetch-Dest': 'document',
             'Sec-Fetch-Mode': 'navigate',
             'Sec-Fetch-Site': 'none',
             'Cache-Control': 'max-age=0'
-        })
-    
-    def make_request(self, url, **kwargs):
-        # Rate limiting
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
-        if time_since_last < self.min_delay:
-            time.sleep(self.min_delay - time_since_last)
-        
-        try:
-            response = self.session.get(url, timeout=15, **kwargs)
-            response.raise_for_status()
-            self.last_request_time = time.time()
-            return response
-        except requests.RequestException as e:
-            print(f"Request error for {url}: {e}")
-            raise
+        }
+
+    def source_key(self, anime_url):
+        """Chiave dell'anime sul sito (lo slug dell'URL), da cui source_url ricostruisce la pagina senza cercarla"""
+        path = urlparse(anime_url).path
+        return path[len(self.anime_path):] if path.startswith(self.anime_path) else path
+
+    def source_url(self, key):
+        """Pagina dell'anime: la chiave arriva dall'id Stremio, quindi niente host, schemi o .. che escano dal sito"""
+        if not re.fullmatch(r'[\w\-./%]+', key) or '//' in key or '..' in key:
+            raise ValueError(f"Chiave anime non valida: {key}")
+        return self.base_url + (key if key.startswith('/') else self.anime_path + key)
+
+    @property
+    def client(self):
+        # Client async condiviso da tutta l'app, niente thread.
+        # Il rate limiting per host (token bucket, limiti in config.json) lo applica il client
+        return get_client()
+
+    async def make_request(self, url, **kwargs):
+        headers = {**self.default_headers, **kwargs.pop('headers', {})}
+        kwargs.setdefault('timeout', 15)
+
+        for attempt in range(self.retry_total + 1):
+            try:
+                response = await self.client.get(url, headers=headers, **kwargs)
+                if response.status_code in self.retry_status and attempt < self.retry_total:
+                    await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+                    continue
+                response.raise_for_status()
+                return response
+            except RequestsError as e:
+                if attempt < self.retry_total and getattr(e, 'response', None) is None:
+                    await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+                    continue
+                print(f"Request error for {url}: {e}")
+                raise
@@ -1,4 +1,3 @@
-import requests
 from bs4 import BeautifulSoup
 import re
 import json
@@ -7,20 +6,22 @@ import Src.Utilities.config as config
 from scrapers.base_scraper import BaseScraper
 
 class GogoAnimeScraper(BaseScraper):
+    anime_path = '/category/'
+
     def __init__(self):
         super().__init__()
         self.name = "GogoAnime"
         self.base_url = "https://www.anitaku.to"
         self.enabled = config.GA == "1"
         
-    def search(self, query):
+    async def search(self, query):
         if not self.enabled:
             return []
             
         try:
             search_url = f"{self.base_url}/search.html"
             params = {'keyword': query}
-            response = self.make_request(search_url, params=params)
+            response = await self.make_request(search_url, params=params)
             soup = BeautifulSoup(response.text, 'html.parser')
             
             results = []
@@ -91,12 +92,12 @@ class GogoAnimeScraper(BaseScraper):
             print(f"GogoAnime search error: {e}")
             return []
     
-    def get_episodes(self, anime_url):
+    async def get_episodes(self, anime_url):
         if not self.enabled:
             return []
             
         try:
-            response = self.make_request(anime_url)
+            response = await self.make_request(anime_url)
             soup = BeautifulSoup(response.text, 'html.parser')
             
             episodes = []
@@ -160,12 +161,12 @@ class GogoAnimeScraper(BaseScraper):
             print(f"GogoAnime episodes error: {e}")
             return []
     
-    def get_stream_links(self, episode_url):
+    async def get_stream_links(self, episode_url):
         if not self.enabled:
             return []
             
         try:
-            response = self.make_request(episode_url)
+            response = await self.make_request(episode_url)
             soup = BeautifulSoup(response.text, 'html.parser')
             
             streams = []